@@ -0,0 +1,95 @@
+"""
+Tests for cron expressions.
+
+"""
+
+from datetime import datetime
+
+import pytest
+
+from web.framework.cron import Cron
+
+
+def fires(expression, after, count=1):
+    cron = Cron(expression)
+    moments = []
+    for _ in range(count):
+        after = cron.next_fire(after)
+        moments.append(after)
+    return moments
+
+
+def test_strictly_after():
+    assert fires("30 9 * * *", datetime(2024, 6, 7, 9, 30)) == \
+        [datetime(2024, 6, 8, 9, 30)]
+    assert fires("30 9 * * *", datetime(2024, 6, 7, 9, 29, 59, 999)) == \
+        [datetime(2024, 6, 7, 9, 30)]
+
+
+def test_steps_and_lists():
+    assert fires("*/20 8-9 * * *", datetime(2024, 6, 7, 9, 45), 3) == \
+        [datetime(2024, 6, 8, 8, 0), datetime(2024, 6, 8, 8, 20),
+         datetime(2024, 6, 8, 8, 40)]
+    assert fires("0 0,12 * * *", datetime(2024, 6, 7, 1), 2) == \
+        [datetime(2024, 6, 7, 12), datetime(2024, 6, 8, 0)]
+
+
+def test_names_and_sunday():
+    for expression in ("0 0 * * sun", "0 0 * * 0", "0 0 * * 7"):
+        assert fires(expression, datetime(2024, 6, 7)) == \
+            [datetime(2024, 6, 9)]
+    assert fires("0 0 1 jul-aug *", datetime(2024, 6, 7), 3) == \
+        [datetime(2024, 7, 1), datetime(2024, 8, 1), datetime(2025, 7, 1)]
+    assert fires("0 0 * * fri-sun", datetime(2024, 6, 6), 4) == \
+        [datetime(2024, 6, 7), datetime(2024, 6, 8), datetime(2024, 6, 9),
+         datetime(2024, 6, 14)]
+    assert fires("0 0 * * sun-sat", datetime(2024, 6, 6), 2) == \
+        [datetime(2024, 6, 7), datetime(2024, 6, 8)]
+
+
+def test_day_of_month_or_day_of_week():
+    # both restricted: the 13th of the month or any friday
+    assert fires("0 0 13 * fri", datetime(2024, 6, 1), 4) == \
+        [datetime(2024, 6, 7), datetime(2024, 6, 13),
+         datetime(2024, 6, 14), datetime(2024, 6, 21)]
+    # only one restricted: the other field does not widen the match
+    assert fires("0 0 13 * *", datetime(2024, 6, 1), 2) == \
+        [datetime(2024, 6, 13), datetime(2024, 7, 13)]
+    assert fires("0 0 * * fri", datetime(2024, 6, 1), 2) == \
+        [datetime(2024, 6, 7), datetime(2024, 6, 14)]
+    # a stepped wildcard is still unrestricted: odd days that are mondays
+    assert fires("0 0 */2 * mon", datetime(2024, 6, 1), 3) == \
+        [datetime(2024, 6, 3), datetime(2024, 6, 17), datetime(2024, 7, 1)]
+
+
+def test_month_rollover():
+    assert fires("0 0 1 * *", datetime(2024, 1, 31, 23, 59)) == \
+        [datetime(2024, 2, 1)]
+    assert fires("59 23 31 12 *", datetime(2024, 12, 31, 23, 59)) == \
+        [datetime(2025, 12, 31, 23, 59)]
+    # months without a 31st are skipped
+    assert fires("0 0 31 * *", datetime(2024, 1, 31), 3) == \
+        [datetime(2024, 3, 31), datetime(2024, 5, 31), datetime(2024, 7, 31)]
+    assert fires("0 0 29 2 *", datetime(2024, 3, 1)) == \
+        [datetime(2028, 2, 29)]
+
+
+def test_impossible_dates():
+    assert Cron("0 0 30 2 *").next_fire(datetime(2024, 1, 1)) is None
+    assert Cron("0 0 31 apr,jun,sep,nov *").next_fire(datetime(2024, 1, 1)) \
+        is None
+    # a day of the week rescues an otherwise impossible day of the month
+    assert fires("0 0 30 2 mon", datetime(2024, 1, 1)) == \
+        [datetime(2024, 2, 5)]
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "* * * * * *",
+                                        "60 * * * *", "* 24 * * *",
+                                        "* * 0 * *", "* * * 13 *",
+                                        "* * * * 8", "*/0 * * * *",
+                                        "5-1 * * * *", "* * * foo *",
+                                        "* * * nov-feb *",
+                                        "* * * * sat-mon"])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        Cron(expression)
@@ -484,6 +484,42 @@ class TemplateResult(dict):
             self._body = "".join(str(p) if p else "" for p in self._parts)
         return self._body
 
+    def stream(self):
+        """
+        yield the text of `str(self)` part by part without joining the parts
+
+            >>> template = TemplateResult(" hello, ", "world ")
+            >>> list(template.stream())
+            ['hello,', ' world']
+
+        """
+        if self._body is not None:
+            yield str(self)
+            return
+        pending = ""
+        started = False
+        for part in self._iter_parts():
+            if not started:
+                part = part.lstrip()
+                if not part:
+                    continue
+                started = True
+            stripped = part.rstrip()
+            if stripped:
+                yield pending + stripped
+                pending = part[len(stripped):]
+            else:
+                pending += part
+
+    def _iter_parts(self):
+        for part in self._parts:
+            if not part:
+                continue
+            if isinstance(part, TemplateResult):
+                yield from part.stream()
+            else:
+                yield str(part)
+
     def __str__(self):
         return str(self.body).strip()
 
@@ -0,0 +1,99 @@
+"""
+Tests for the streaming `multipart/form-data` parser.
+
+"""
+
+import pytest
+
+from web.framework.multipart import (BodyTooLarge, MalformedBody,
+                                     parse_multipart, read_chunks)
+
+boundary = "XyZ123"
+payload = bytes(range(256)) + b"\r\n--XyZ12\r\n-" + b"\x00\xff" * 64
+
+
+def build(*parts, preamble=b""):
+    body = preamble
+    for headers, content in parts:
+        body += (b"--" + boundary.encode() + b"\r\n" + headers +
+                 b"\r\n\r\n" + content + b"\r\n")
+    return body + b"--" + boundary.encode() + b"--\r\n"
+
+
+body = build((b'Content-Disposition: form-data; name="title"', b"hello"),
+             (b'Content-Disposition: form-data; name="upload"; '
+              b'filename="blob.bin"\r\nContent-Type: application/octet-stream',
+              payload),
+             (b'Content-Disposition: form-data; name="tag"', b"a"),
+             (b'Content-Disposition: form-data; name="tag"', b"b"),
+             preamble=b"ignored preamble\r\n")
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_whole_body():
+    form = parse_multipart([body], boundary)
+    assert list(form.keys()) == ["title", "upload", "tag"]
+    assert form.getfirst("title") == "hello"
+    assert form.getlist("tag") == ["a", "b"]
+    upload = form["upload"]
+    assert upload.filename == "blob.bin"
+    assert upload.content_type == "application/octet-stream"
+    assert upload.value == payload
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 11, 64, 255])
+def test_boundaries_split_across_chunks(size):
+    form = parse_multipart(split(body, size), boundary)
+    assert form.getfirst("title") == "hello"
+    assert form.getlist("tag") == ["a", "b"]
+    assert form["upload"].value == payload
+
+
+def test_binary_part_spools_to_disk():
+    big = payload * 64
+    data = build((b'Content-Disposition: form-data; name="f"; '
+                  b'filename="big.bin"', big))
+    form = parse_multipart(split(data, 1000), boundary, spool_size=1024)
+    upload = form["f"]
+    assert upload.file._rolled
+    assert upload.value == big
+
+
+def test_empty_parts():
+    data = build((b'Content-Disposition: form-data; name="empty"', b""),
+                 (b'Content-Disposition: form-data; name="f"; '
+                  b'filename="empty.txt"', b""))
+    form = parse_multipart(split(data, 4), boundary)
+    assert form.getfirst("empty") == ""
+    assert form["f"].value == b""
+
+
+def test_truncated_body():
+    with pytest.raises(MalformedBody):
+        parse_multipart(split(body[:len(body) // 2], 16), boundary)
+
+
+def test_oversized_headers():
+    data = build((b"X-Padding: " + b"a" * 512, b""))
+    with pytest.raises(MalformedBody):
+        parse_multipart(split(data, 64), boundary, max_header_size=256)
+
+
+def test_read_chunks_limit():
+    class Stream:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self, size):
+            chunk, self.data = self.data[:size], self.data[size:]
+            return chunk
+
+    assert b"".join(read_chunks(Stream(body), len(body),
+                                chunk_size=7)) == body
+    with pytest.raises(BodyTooLarge):
+        list(read_chunks(Stream(body), len(body), limit=len(body) - 1))
+    with pytest.raises(BodyTooLarge):
+        list(read_chunks(Stream(body), limit=len(body) - 1, chunk_size=7))
@@ -0,0 +1,87 @@
+"""
+Tests for the framework's precompiled router.
+
+"""
+
+import pytest
+
+from web.framework import PermanentRedirect, ResourceNotFound, Router
+
+
+class Mounted:
+
+    def __init__(self):
+        self.router = Router()
+
+
+def test_first_match_across_buckets():
+    router = Router()
+    router.add_route(r"people/new", "NewPerson")
+    router.add_route(r"(?P<section>\w+)/new", "NewThing")
+    router.add_route(r"people/(?P<name>\w+)", "Person")
+    router.add_route(r"(?P<section>\w+)/(?P<name>\w+)", "Thing")
+    assert router.resolve("people/new") == ("NewPerson", {}, {})
+    assert router.resolve("places/new") == \
+        ("NewThing", {"section": "places"}, {})
+    assert router.resolve("people/alice") == \
+        ("Person", {"name": "alice"}, {})
+    assert router.resolve("places/home") == \
+        ("Thing", {"section": "places", "name": "home"}, {})
+
+
+def test_wildcard_registered_first_wins():
+    router = Router()
+    router.add_route(r"(?P<section>\w+)/(?P<name>\w+)", "Thing")
+    router.add_route(r"people/(?P<name>\w+)", "Person")
+    router.add_route(r"people", "People")
+    assert router.resolve("people/alice") == \
+        ("Thing", {"section": "people", "name": "alice"}, {})
+    assert router.resolve("people") == ("People", {}, {})
+
+
+def test_alternation_joins_every_bucket():
+    router = Router()
+    router.add_route(r"about|colophon", "About")
+    router.add_route(r"about", "Unreachable")
+    assert router.resolve("about") == ("About", {}, {})
+    assert router.resolve("colophon") == ("About", {}, {})
+
+
+def test_not_found_and_redirect():
+    router = Router()
+    router.add_route(r"people/(?P<name>\w+)", "Person")
+    assert router.resolve("people") == (ResourceNotFound, {}, {})
+    assert router.resolve("places/home") == (ResourceNotFound, {}, {})
+    with pytest.raises(PermanentRedirect):
+        router.resolve("people/alice/")
+
+
+def test_unquoted_arguments():
+    router = Router()
+    router.add_route(r"tags/(?P<tag>.+)", "Tag")
+    assert router.resolve("tags/caf%C3%A9") == ("Tag", {"tag": "café"}, {})
+
+
+def test_mounts():
+    router = Router()
+    blog = Mounted()
+    blog.router.add_route(r"", "Posts")
+    blog.router.add_route(r"(?P<slug>[\w-]+)", "Post")
+    router.add_mount(r"(?P<author>\w+)/blog", blog)
+    router.add_route(r"(?P<author>\w+)", "Author")
+    assert router.resolve("alice") == ("Author", {"author": "alice"}, {})
+    assert router.resolve("alice/blog") == ("Posts", {}, {"author": "alice"})
+    assert router.resolve("alice/blog/hello-world") == \
+        ("Post", {"slug": "hello-world"}, {"author": "alice"})
+
+
+def test_additions_reset_memoized_resolutions():
+    router = Router()
+    blog = Mounted()
+    router.add_mount(r"blog", blog)
+    assert router.resolve("about") == (ResourceNotFound, {}, {})
+    assert router.resolve("blog/hello") == (ResourceNotFound, {}, {})
+    router.add_route(r"about", "About")
+    blog.router.add_route(r"(?P<slug>\w+)", "Post")
+    assert router.resolve("about") == ("About", {}, {})
+    assert router.resolve("blog/hello") == ("Post", {"slug": "hello"}, {})
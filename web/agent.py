@@ -1,10 +1,22 @@
 """."""
 
+import collections
+import contextlib
+import copy
 import datetime
+import email.utils
+import functools
+import hashlib
 import json
 import re
 import time
+import urllib.parse
 
+import gevent
+import gevent.lock
+import gevent.pool
+import gevent.queue
+import hstspreload
 import lxml.html
 import mf
 import networkx as nx
@@ -21,7 +33,8 @@ import solarized
 import sql
 import uri
 
-__all__ = ["get", "post", "subscribe", "parse", "browser", "cache", "discover_link"]
+__all__ = ["get", "post", "fetch_many", "subscribe", "parse", "browser",
+           "cache", "discover_link"]
 
 displays = []
 browsers = []
@@ -30,6 +43,220 @@ tor_proxies = {"http": "socks5h://localhost:9050",
                "https": "socks5h://localhost:9050"}
 
 
+class SessionPool:
+
+    """
+    keep-alive `requests` sessions kept per host
+
+    Up to `size` sessions are opened for each scheme and host, each
+    holding up to `maxsize` connections. Greenlets wait for a session to
+    be returned when all of a host's are in use. Sessions left idle for
+    longer than `idle_timeout` seconds are closed. Requests made without
+    a `timeout` are given the pool's `connect_timeout`, and its
+    `read_timeout` when one is set; by default a slow response is waited
+    on for as long as it takes.
+
+    Sessions keep no cookies between requests.
+
+    """
+
+    def __init__(self, size=4, maxsize=10, connect_timeout=3.05,
+                 read_timeout=None, idle_timeout=90, proxies=None):
+        self.size = size
+        self.maxsize = maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.proxies = proxies
+        self.idle = {}
+        self.opened = collections.Counter()
+        self.swept = time.monotonic()
+
+    def __repr__(self):
+        return (f"<sessionpool: {sum(self.opened.values())} sessions open "
+                f"to {len(self.opened)} hosts>")
+
+    def _open(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=self.maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if self.proxies:
+            session.proxies.update(self.proxies)
+        return session
+
+    @contextlib.contextmanager
+    def session(self, url):
+        """check out a session to the host of `url` for a `with` block"""
+        scheme, host = urllib.parse.urlsplit(url)[:2]
+        key = f"{scheme}://{host}".lower()
+        self.sweep()
+        idle = self.idle.setdefault(key, gevent.queue.LifoQueue())
+        try:
+            session, _ = idle.get_nowait()
+        except gevent.queue.Empty:
+            if self.opened[key] < self.size:
+                self.opened[key] += 1
+                session = self._open()
+            else:
+                session, _ = idle.get()
+        try:
+            yield session
+        finally:
+            session.cookies.clear()
+            idle.put((session, time.monotonic()))
+
+    def request(self, method, url, **kwargs):
+        """return the response to a request made on a pooled session"""
+        kwargs.setdefault("timeout", (self.connect_timeout,
+                                      self.read_timeout))
+        with self.session(url) as session:
+            return session.request(method, url, **kwargs)
+
+    def sweep(self):
+        """close sessions idle for longer than `idle_timeout` seconds"""
+        now = time.monotonic()
+        if now - self.swept < min(self.idle_timeout, 1):
+            return
+        self.swept = now
+        for key, idle in list(self.idle.items()):
+            fresh = []
+            while not idle.empty():
+                session, used = idle.get_nowait()
+                if now - used > self.idle_timeout:
+                    session.close()
+                    self.opened[key] -= 1
+                else:
+                    fresh.append((session, used))
+            for session in fresh:
+                idle.put(session)
+            if not self.opened[key]:  # none checked out so none awaited
+                del self.opened[key]
+                del self.idle[key]
+
+    def close(self):
+        """close every idle session"""
+        idle_timeout, self.idle_timeout = self.idle_timeout, -1
+        self.swept = 0
+        try:
+            self.sweep()
+        finally:
+            self.idle_timeout = idle_timeout
+
+
+sessions = SessionPool()
+tor_sessions = SessionPool(connect_timeout=30, proxies=tor_proxies)
+
+
+class SchemeMemo:
+
+    """
+    the scheme known to work for each host
+
+    Hosts are remembered for `ttl` seconds after answering; hosts that
+    refused HTTPS only for `ttl` seconds after doing so, and hosts whose
+    HTTPS timed out only for `timeout_ttl` seconds, whereupon HTTPS is
+    tried again. Hosts on the HSTS preload list, and those that have
+    sent a `Strict-Transport-Security` header over HTTPS, are held to
+    HTTPS for the header's `max-age`. At most `size` hosts are kept, the
+    least recently used being forgotten first.
+
+    """
+
+    preload_ttl = 31536000
+
+    def __init__(self, size=4096, ttl=3600, timeout_ttl=300):
+        self.size = size
+        self.ttl = ttl
+        self.timeout_ttl = timeout_ttl
+        self.hosts = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return (f"<schememo: {len(self.hosts)} hosts, {self.hits} hits, "
+                f"{self.misses} misses>")
+
+    def _remember(self, host, scheme, strict, expires):
+        self.hosts[host] = scheme, strict, expires
+        self.hosts.move_to_end(host)
+        while len(self.hosts) > self.size:
+            self.hosts.popitem(last=False)
+
+    def get(self, host):
+        """return the `(scheme, strict)` known for `host` or None"""
+        host = host.lower()
+        try:
+            scheme, strict, expires = self.hosts[host]
+        except KeyError:
+            pass
+        else:
+            if expires > time.monotonic():
+                self.hosts.move_to_end(host)
+                self.hits += 1
+                return scheme, strict
+            del self.hosts[host]
+        self.misses += 1
+        if hstspreload.in_hsts_preload(host):
+            self._remember(host, "https", True,
+                           time.monotonic() + self.preload_ttl)
+            return "https", True
+        return None
+
+    def learn(self, host, scheme, headers=None, ttl=None):
+        """remember that `host` answered over `scheme` with `headers`"""
+        host = host.lower()
+        headers = headers or {}
+        now = time.monotonic()
+        strict, expires = False, now + (ttl or self.ttl)
+        known, was_strict, expiry = self.hosts.get(host, (None, False, 0))
+        if scheme == "http" and known == "http" and expiry > now:
+            return  # HTTPS is tried again once the entry has expired
+        if scheme == "https":
+            if was_strict and expiry > now:
+                strict, expires = True, max(expiry, expires)
+            max_age = get_hsts_max_age(headers.get(
+                                       "Strict-Transport-Security"))
+            if max_age is not None:
+                strict = bool(max_age)
+                expires = now + (max_age or self.ttl)
+        self._remember(host, scheme, strict, expires)
+
+    def forget(self, host):
+        """forget `host` unless it is held to HTTPS"""
+        host = host.lower()
+        if not self.hosts.get(host, (None, False))[1]:
+            self.hosts.pop(host, None)
+
+
+def get_hsts_max_age(header):
+    """
+    return the `max-age` of a `Strict-Transport-Security` header or None
+
+        >>> get_hsts_max_age('max-age="31536000"; includeSubDomains')
+        31536000
+
+    """
+    for directive in (header or "").split(";"):
+        name, _, value = directive.partition("=")
+        if name.strip().lower() == "max-age":
+            try:
+                return int(value.strip().strip('"'))
+            except ValueError:
+                return None
+    return None
+
+
+schemes = SchemeMemo()
+
+
+def get_session_pool(url):
+    """return the session pool for `url`, routing onion services via Tor"""
+    host = urllib.parse.urlsplit(url).hostname or ""
+    return tor_sessions if host.endswith(".onion") else sessions
+
+
 def discover_link(target, name):
     # TODO head = request("HEAD", target)
     # TODO if head.status_code == 200:
@@ -85,28 +312,53 @@ def request(method, url, **kwargs):
     """
     return the response to dereferencing given `url` using given `method`
 
-    Attempts to use HTTPS when accessing non-onion domains. Proxies
+    Attempts to use HTTPS when accessing non-onion domains, falling back
+    to HTTP unless the host is held to HTTPS, and remembers the scheme
+    that worked in `schemes`. HTTP is remembered for less time when HTTPS
+    timed out rather than being refused. A response that times out once
+    the connection is made is not retried over the other scheme. Proxies
     through Tor when accessing onion services. Optionally pass typical
     `requests.Request` arguments as `kwargs`.
 
     """
     url = uri.parse(url)
-    preferred = "https"
+    failures = (requests.exceptions.SSLError,
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout)
     if url.suffix == "onion":
-        kwargs["proxies"] = tor_proxies
-        preferred = "http"
-    try:
-        response = requests.request(method, f"{preferred}://{url.minimized}",
-                                    **kwargs)
-    except (requests.exceptions.SSLError, requests.exceptions.ConnectionError):
-        if url.suffix != "onion":
-            try:
-                response = requests.request(method, f"http://{url.minimized}",
-                                            **kwargs)
-            except (requests.exceptions.SSLError,
-                    requests.exceptions.ConnectionError):
-                raise RequestFailed()
-    return response
+        try:
+            return tor_sessions.request(method, f"http://{url.minimized}",
+                                        **kwargs)
+        except failures:
+            raise RequestFailed()
+    candidates = ("https", "http")
+    known = schemes.get(url.host)
+    if known == ("http", False):
+        candidates = ("http", "https")
+    elif known == ("https", True):
+        candidates = ("https",)
+    refused = timed_out = False
+    for scheme in candidates:
+        try:
+            response = sessions.request(method,
+                                        f"{scheme}://{url.minimized}",
+                                        **kwargs)
+        except requests.exceptions.ReadTimeout:
+            raise RequestFailed()  # the host answered; don't send it twice
+        except failures as err:
+            if scheme == "https":
+                if isinstance(err, requests.exceptions.Timeout):
+                    timed_out = True
+                else:
+                    refused = True
+            continue
+        if scheme == "https" or refused:
+            schemes.learn(url.host, scheme, response.headers)
+        elif timed_out:  # a timeout may be transient so retry HTTPS soon
+            schemes.learn(url.host, scheme, ttl=schemes.timeout_ttl)
+        return response
+    schemes.forget(url.host)
+    raise RequestFailed()
 
 
 class RequestFailed(Exception):
@@ -124,6 +376,62 @@ def post(url, **kwargs):
     return Transaction(url, "post", **kwargs)
 
 
+Fetch = collections.namedtuple("Fetch", "url transaction error")
+
+
+def fetch_many(urls, method="get", concurrency=20, per_host=2, delay=0,
+               deadline=30, **kwargs):
+    """
+    yield a `Fetch` of each of `urls` as its request completes
+
+    At most `concurrency` requests are made at once and at most `per_host`
+    of them to any one host, each starting at least `delay` seconds after
+    the last to its host. A host only takes up a slot while a request to
+    it is under way so that a host with many URLs never holds slots that
+    other hosts could use. A request that takes longer than `deadline`
+    seconds is abandoned. Failures are reported in the `error` of their
+    `Fetch` rather than raised. Optionally pass typical
+    `requests.Request` arguments as `kwargs`.
+
+    """
+    urls = list(urls)
+    results = gevent.queue.Queue()
+    queues = collections.OrderedDict()
+    for url in urls:
+        try:
+            host = uri.parse(str(url)).host
+        except ValueError as err:
+            results.put(Fetch(url, None, err))
+            continue
+        queues.setdefault(host, collections.deque()).append(url)
+    slots = gevent.lock.BoundedSemaphore(concurrency)
+    next_starts = collections.defaultdict(float)
+
+    def fetch(host, queue):  # one of up to `per_host` lanes to `host`
+        while queue:
+            url = queue.popleft()
+            while next_starts[host] > time.monotonic():
+                gevent.sleep(next_starts[host] - time.monotonic())
+            next_starts[host] = time.monotonic() + delay
+            with slots:
+                try:
+                    with gevent.Timeout(deadline):
+                        results.put(Fetch(url, Transaction(url, method,
+                                                           **kwargs), None))
+                except (Exception, gevent.Timeout) as err:
+                    results.put(Fetch(url, None, err))
+
+    lanes = gevent.pool.Group()
+    for host, queue in queues.items():
+        for _ in range(min(per_host, len(queue))):
+            lanes.spawn(fetch, host, queue)
+    try:
+        for _ in urls:
+            yield results.get()
+    finally:
+        lanes.kill()
+
+
 def subscribe(url):
     """Subscribe from the web using Braid."""
     return requests.get(url, headers={"Subscribe": "keep-alive"}, stream=True)
@@ -151,16 +459,194 @@ def multi_subscribe(*urls):
         yield patch + b"\n"
 
 
+cacheable_statuses = {200, 203, 204, 300, 301, 404, 405, 410, 414, 501}
+heuristic_limit = 86400  # longest freshness guessed from `Last-Modified`
+unstored_headers = {"content-length", "content-encoding", "transfer-encoding"}
+
+
+def parse_cache_control(header):
+    """
+    return the directives of a `Cache-Control` header
+
+        >>> parse_cache_control('max-age=60, no-cache="Set-Cookie", public')
+        {'max-age': '60', 'no-cache': 'Set-Cookie', 'public': None}
+
+    """
+    directives = {}
+    for directive in (header or "").split(","):
+        name, equals, value = directive.partition("=")
+        name = name.strip().lower()
+        if name:
+            directives[name] = value.strip().strip('"') if equals else None
+    return directives
+
+
+def get_seconds(directives, name):
+    """return the number of seconds given by directive `name` or None"""
+    try:
+        return max(0, int(directives[name]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def parse_http_date(value):
+    """return the timestamp of an HTTP date or None if it is invalid"""
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class CachedResponse:
+
+    """
+    a stored response
+
+    `stored` is when the response was generated as far as its `Age`
+    header tells so that `age` is its current age.
+
+    """
+
+    def __init__(self, url, status, headers, body, encoding, stored):
+        self.url = url
+        self.status = status
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.body = body
+        self.encoding = encoding
+        self.stored = stored
+
+    @classmethod
+    def from_response(cls, url, response, received):
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in unstored_headers}
+        return cls(url, response.status_code, headers, response.content,
+                   response.encoding, received - get_age(response.headers))
+
+    @property
+    def size(self):
+        return len(self.body)
+
+    @property
+    def directives(self):
+        return parse_cache_control(self.headers.get("Cache-Control"))
+
+    @property
+    def age(self):
+        return max(0, time.time() - self.stored)
+
+    @property
+    def lifetime(self):
+        """the seconds the response stays fresh for after RFC 7234 4.2.1"""
+        directives = self.directives
+        if "no-cache" in directives:
+            return 0
+        max_age = get_seconds(directives, "max-age")
+        if max_age is not None:
+            return max_age
+        date = parse_http_date(self.headers.get("Date")) or self.stored
+        if "Expires" in self.headers:
+            expires = parse_http_date(self.headers["Expires"])
+            return max(0, expires - date) if expires else 0
+        last_modified = parse_http_date(self.headers.get("Last-Modified"))
+        if last_modified and self.status in cacheable_statuses:
+            return min(max(0, date - last_modified) / 10, heuristic_limit)
+        return 0
+
+    @property
+    def stale_while_revalidate(self):
+        directives = self.directives
+        if "must-revalidate" in directives or "no-cache" in directives:
+            return 0
+        return get_seconds(directives, "stale-while-revalidate") or 0
+
+    @property
+    def validators(self):
+        """the headers of a conditional request for this response"""
+        conditions = {}
+        if "ETag" in self.headers:
+            conditions["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            conditions["If-Modified-Since"] = self.headers["Last-Modified"]
+        return conditions
+
+    @property
+    def is_storable(self):
+        """whether the response could ever be served from the cache"""
+        if "no-store" in self.directives or self.headers.get("Vary") == "*":
+            return False
+        lifetime = self.lifetime
+        if self.status not in cacheable_statuses:
+            return lifetime > 0
+        return bool(lifetime or self.validators or
+                    self.stale_while_revalidate)
+
+    def refresh(self, headers, received):
+        """adopt the headers of a `304 Not Modified` response"""
+        self.headers.update({name: value for name, value in headers.items()
+                             if name.lower() not in unstored_headers})
+        self.stored = received - get_age(headers)
+
+    def get_transaction(self):
+        """return a new `Transaction` for the response without refetching"""
+        response = requests.Response()
+        response.url = self.url
+        response.status_code = self.status
+        response.headers = self.headers.copy()
+        response.encoding = self.encoding
+        response._content = self.body
+        transaction = Transaction(self.url, fetch=False)
+        transaction.response = response
+        transaction.text = response.text
+        transaction.headers = response.headers
+        return transaction
+
+
+def get_age(headers):
+    """return the seconds given by the `Age` header"""
+    try:
+        return max(0, int(headers.get("Age", 0)))
+    except ValueError:
+        return 0
+
+
 class Cache:
 
-    def __init__(self, domain=None, db=None):
-        self.cache = {}
+    """
+    an HTTP cache of `Transaction`s after RFC 7234
+
+    Up to `max_bytes` of response bodies are held in memory, the least
+    recently used first out, and with `db` every stored response is
+    persisted there. Fresh responses are served as stored. Stale ones are
+    revalidated with `If-None-Match`/`If-Modified-Since`, a `304 Not
+    Modified` refreshing the stored response, or within their
+    `stale-while-revalidate` served as stored while they are revalidated
+    in the background. Responses marked `no-store` are never stored.
+    Each lookup returns a new `Transaction` so that callers never share
+    parsed views and only the stored bodies take up memory.
+
+    Outcomes are counted in `metrics`.
+
+    """
+
+    def __init__(self, domain=None, db=None, max_bytes=2**26):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.metrics = collections.Counter()
+        self.revalidating = {}
+        self.db = None
         if domain:
             self.domain = domain
         if db:
             self.db = sql.db(db)
-            self.db.define(resources="""url TEXT UNIQUE, html TEXT,
-                                        data JSON""")
+            self.db.define(http_cache="""url TEXT PRIMARY KEY,
+                                         status INTEGER, headers TEXT,
+                                         body BLOB, encoding TEXT,
+                                         stored REAL""")
+
+    def __repr__(self):
+        return (f"<cache: {len(self.entries)} responses in {self.size} "
+                f"bytes, {dict(self.metrics)}>")
 
     def format_url(self, url):
         try:
@@ -169,36 +655,109 @@ class Cache:
             url = url
         return url
 
+    def _remember(self, entry):
+        self._forget(entry.url)
+        if entry.size > self.max_bytes:
+            return
+        self.entries[entry.url] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.metrics["evictions"] += 1
+
+    def _forget(self, url):
+        entry = self.entries.pop(url, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _load(self, url):
+        try:
+            entry = self.entries[url]
+        except KeyError:
+            pass
+        else:
+            self.entries.move_to_end(url)
+            return entry
+        if self.db is None:
+            return None
+        try:
+            row = self.db.select("http_cache", where="url = ?",
+                                 vals=[url])[0]
+        except IndexError:
+            return None
+        entry = CachedResponse(url, row["status"], json.loads(row["headers"]),
+                               row["body"], row["encoding"], row["stored"])
+        self._remember(entry)
+        return entry
+
+    def _store(self, entry):
+        self._remember(entry)
+        self.metrics["stores"] += 1
+        if self.db is not None:
+            self.db.replace("http_cache", url=entry.url, status=entry.status,
+                            headers=json.dumps(dict(entry.headers)),
+                            body=entry.body, encoding=entry.encoding,
+                            stored=entry.stored)
+
+    def _discard(self, url):
+        self._forget(url)
+        if self.db is not None:
+            self.db.delete("http_cache", where="url = ?", vals=[url])
+
+    def _fetch(self, url, entry=None):
+        headers = {}
+        if entry is not None:
+            headers = entry.validators
+            self.metrics["revalidations"] += 1
+        received = time.time()
+        transaction = Transaction(url, headers=headers)
+        if entry is not None and transaction.response.status_code == 304:
+            self.metrics["not_modified"] += 1
+            entry.refresh(transaction.response.headers, received)
+            self._store(entry)
+            return entry.get_transaction()
+        fetched = CachedResponse.from_response(url, transaction.response,
+                                               received)
+        if fetched.is_storable:
+            self._store(fetched)
+        elif entry is not None:
+            self._discard(url)
+        return transaction
+
+    def _revalidate(self, url, entry):
+        try:
+            self._fetch(url, entry)
+        finally:
+            del self.revalidating[url]
+
     def add(self, *resource_urls):
+        """fetch and store each of `resource_urls` whether stored or not"""
         for resource_url in resource_urls:
-            url = self.format_url(resource_url)
-            resource = get(url)
-            self.cache[resource_url] = resource
-            try:
-                self.db.insert("resources", url=url, html=resource.text,
-                               data=resource.mf2json.data)
-            except AttributeError:
-                pass
+            self._fetch(self.format_url(resource_url))
 
     def __getitem__(self, resource_url):
-        try:
-            resource = self.cache[resource_url]
-        except KeyError:
-            try:
-                url = self.format_url(resource_url)
-                resource_data = self.db.select("resources", where="url = ?",
-                                               vals=[url])[0]
-                resource = Transaction(url, fetch=False)
-                resource.text = resource_data["html"]
-            except (AttributeError, IndexError):
-                self.add(resource_url)
-                resource = self.cache[resource_url]
-        return resource
+        url = self.format_url(resource_url)
+        entry = self._load(url)
+        if entry is None:
+            self.metrics["misses"] += 1
+            return self._fetch(url)
+        age, lifetime = entry.age, entry.lifetime
+        if age < lifetime:
+            self.metrics["hits"] += 1
+            return entry.get_transaction()
+        if age < lifetime + entry.stale_while_revalidate:
+            self.metrics["stale_hits"] += 1
+            if url not in self.revalidating:
+                self.revalidating[url] = gevent.spawn(self._revalidate, url,
+                                                      entry)
+            return entry.get_transaction()
+        return self._fetch(url, entry)
 
     @property
     def graph(self):
         network = nx.DiGraph()
-        for url, resource in self.cache.items():
+        for url, resource in self.entries.items():
             # print(resource.links)
             network.add_node(url)
         return nx.draw(network, with_labels=True)
@@ -207,17 +766,67 @@ class Cache:
 cache = Cache
 
 
+mf2_cache = collections.OrderedDict()
+mf2_cache_size = 256
+
+
+def parse_mf2(text, url):
+    """
+    return the microformats of `text` found at `url`
+
+    Results are shared across transactions keyed by a hash of the text so
+    that a body fetched again is not parsed again. Each caller gets its
+    own copy.
+
+    """
+    key = hashlib.sha256(text.encode("utf-8")).digest(), url
+    try:
+        data = mf2_cache[key]
+    except KeyError:
+        data = mf2_cache[key] = mf.parse(text, url)
+        while len(mf2_cache) > mf2_cache_size:
+            mf2_cache.popitem(last=False)
+    else:
+        mf2_cache.move_to_end(key)
+    return copy.deepcopy(data)
+
+
+def view(method):
+    """memoize a view of a transaction's text until the text changes"""
+    @functools.wraps(method)
+    def memoized(self, *args):
+        key = method.__name__, args
+        try:
+            return self.views[key]
+        except KeyError:
+            value = self.views[key] = method(self, *args)
+            return value
+    return memoized
+
+
 class Transaction:
     """."""
 
     def __init__(self, url, method="get", fetch=True, **kwargs):
         self.url = str(uri.parse(str(url)))
+        self.views = {}
         if fetch:
-            handler = getattr(requests, method)
-            self.response = handler(apply_dns(self.url), **kwargs)
+            url = apply_dns(self.url)
+            kwargs.setdefault("allow_redirects", method.lower() != "head")
+            self.response = get_session_pool(url).request(method.upper(),
+                                                          url, **kwargs)
             self.text = self.response.text
             self.headers = self.response.headers
 
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        self.views = {}
+
     @property
     def location(self):
         location = self.headers["location"]
@@ -232,6 +841,7 @@ class Transaction:
         return self.response.links
 
     @property
+    @view
     def dom(self):
         return parse(self.text)
 
@@ -240,29 +850,35 @@ class Transaction:
         return json.loads(self.text)
 
     @property
+    @view
     def mf2json(self):
-        return Semantics(mf.parse(self.text, self.url))
+        return Semantics(parse_mf2(self.text, self.url))
 
     @property
+    @view
     def card(self):
         return Semantics(mf.representative_hcard(self.mf2json.data,
                                                  source_url=self.url))
 
     @property
+    @view
     def entry(self):
         return Semantics(mf.interpret_entry(self.mf2json.data,
                                             source_url=self.url))
 
     @property
+    @view
     def event(self):
         return Semantics(mf.interpret_event(self.mf2json.data,
                                             source_url=self.url))
 
     @property
+    @view
     def jf2(self):
         return Semantics(mf.interpret_feed(self.mf2json.data,
                                            source_url=self.url))
 
+    @view
     def mention(self, *target_urls):
         return Semantics(mf.interpret_comment(self.mf2json.data,
                                               self.url, target_urls))
@@ -13,17 +13,19 @@ a Pythonic API.
 """
 
 from base64 import b64encode, b64decode
-import cgi
 import collections
+import collections.abc
 import datetime
+import email.utils
 # import errno
+import functools
 import getpass
 from gevent import spawn
 from gevent.queue import Queue
 import hashlib
 import hmac
+import html
 import inspect
-import io
 import json
 import jsonpatch
 import os
@@ -47,10 +49,10 @@ import lxml
 import lxml.html
 import mm
 from mm import Template
+from mm.templating import TemplateResult
 import pendulum
 import scrypt
 import sh
-import sql
 import unidecode
 import uri
 try:
@@ -65,13 +67,22 @@ from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
 from .. import headers
-from ..agent import parse, apply_dns, cache
+from ..agent import apply_dns, cache
 from ..response import (Status,  # noqa
                         OK, Created, Accepted, NoContent, MultiStatus,
-                        Found, SeeOther, PermanentRedirect,
+                        Found, SeeOther, NotModified, PermanentRedirect,
                         BadRequest, Unauthorized, Forbidden, NotFound,
-                          MethodNotAllowed, Conflict, Gone)
+                          MethodNotAllowed, Conflict, Gone,
+                          RequestEntityTooLarge)
+from . import multipart
+from .assets import AssetServer, etag_matches, not_modified_since
+from .compression import Compressor, is_compressible
+from .cron import Cron
+from .dbpool import Pool
 from .letsencrypt import generate_cert
+from .pagecache import KVBackend, LocalBackend, Page, PageCache
+from .schema import Schema, migrate, schema
+from .sessions import DatabaseSessionStore, KVSessionStore
 from .newmath import nbencode, nbdecode, nbrandom, nb60_re
 
 import warnings  # mf2py's beautifulsoup's unspecified parser -- force lxml?
@@ -81,15 +92,17 @@ random = secrets.SystemRandom()
 
 __all__ = ["application", "serve", "anti_csrf", "form", "secure_form",
            "get_nonce", "get_token", "best_match", "sessions",
-           "require_auth", "tx", "kv", "header",
-           "Application", "Resource", "nbencode", "nbdecode", "nbrandom",
-           "Template", "config_templates", "generate_cert",
+           "require_auth", "tx", "kv", "header", "head_element", "head_link",
+           "purge_pages", "schema", "Application", "Resource", "nbencode",
+           "nbdecode", "nbrandom", "Template", "config_templates",
+           "generate_cert",
            "get_integrity_factory", "utcnow", "JSONEncoder",
            "default_session_timeout", "uwsgi", "textslug", "get_host_hash",
            "config_servers", "b64encode", "b64decode", "timeslug",
-           "enqueue", "run_redis", "kill_redis", "get_apps", "nb60_re",
-           "wordlist", "generate_passphrase", "verify_passphrase", "sleep",
-           "spawn", "Queue", "random"]
+           "enqueue", "enqueue_many", "enqueue_at", "enqueue_in", "schedule",
+           "run_redis", "kill_redis", "get_apps", "nb60_re", "wordlist",
+           "generate_passphrase", "verify_passphrase", "sleep", "spawn",
+           "Queue", "random"]
 
 kvdb = kv.db("web", ":", {"auth:secret": "string",
                           "auth:nonces": "set",
@@ -101,7 +114,14 @@ config_templates = mm.templates(__name__)
 methods = ["head", "get", "post", "put", "delete", "options", "patch",
            "propfind"]
 applications = {}
+db_pools = {}
+db_pool_size = 4  # handles checked out at once per app and process
+stale_db_pools = []
 default_session_timeout = 86400
+default_chunk_size = 2**13
+job_lanes = ("interactive", "default", "bulk")  # in order of priority
+delayed_jobs_key = "web:jobqueue:delayed"
+stale_run_timeout = 3600  # unfinished runs older than this are presumed lost
 
 
 def ismethod(obj):
@@ -323,11 +343,110 @@ def header(name, value, add=False):
         tx.response.headers[name] = value
 
 
+def head_element(*elements):
+    """
+    add raw HTML `elements` (eg. `<meta>`) to the head of an HTML response
+
+    Elements are spliced into the response body once, after all wrappers
+    have finished, without parsing the document.
+
+    """
+    tx.response.head.extend(elements)
+
+
+def head_link(rel, href, add_header=True):
+    """
+    add a `<link>` to the head of an HTML response and a matching header
+
+    """
+    head_element(f'<link rel="{html.escape(rel)}" href="{html.escape(href)}">')
+    if add_header:
+        header("Link", f'<{href}>; rel="{rel}"', add=True)
+
+
+_head_end_re = re.compile(rb"</head\s*>|<body[\s>]", re.IGNORECASE)
+
+
+def splice_head(document, elements):
+    """
+    return bytes `document` with `elements` inserted at the end of its head
+
+        >>> splice_head(b"<head><title>Hi</title></head><p>Hi",
+        ...             ["<meta charset=utf-8>"])
+        b'<head><title>Hi</title><meta charset=utf-8></head><p>Hi'
+
+    Documents without an explicit head are spliced just before `<body>`.
+    Documents with neither are returned untouched.
+
+    """
+    match = _head_end_re.search(document)
+    if not match:
+        return document
+    index = match.start()
+    return b"".join((document[:index], "".join(elements).encode("utf-8"),
+                     document[index:]))
+
+
+def splice_head_stream(chunks, elements, limit=2**16):
+    """
+    yield bytes `chunks` with `elements` inserted at the end of the head
+
+    Chunks are buffered only until the end of the head is found or the
+    buffer reaches `limit` bytes, after which they pass through untouched.
+
+    """
+    buffer = b""
+    chunks = iter(chunks)
+    for chunk in chunks:
+        buffer += chunk
+        if _head_end_re.search(buffer) or len(buffer) >= limit:
+            break
+    yield splice_head(buffer, elements)
+    yield from chunks
+
+
+def rechunk(chunks, size=default_chunk_size):
+    """yield `chunks` of str or bytes as UTF-8 bytes of at least `size`"""
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def purge_pages(*urls, app=None):
+    """
+    drop every cached rendering of each of `urls` from the page cache
+
+    The cache is that of `app`, by default the current host's. Paths
+    without a host are taken to be on the current host so pass full URLs
+    outside of a request (e.g. in a job). Does nothing when the app has
+    no page cache.
+
+    """
+    if app is None:
+        app = tx.host.app
+    if app.pages is None:
+        return
+    for url in urls:
+        parts = urllib.parse.urlsplit(str(url))
+        app.pages.purge(parts.hostname or tx.host.name, parts.path)
+
+
 def best_match(handlers, *args, **kwargs):
     """"""
     handler_types = [handler for handler, _ in handlers.items()]
     best_match = tx.request.headers.accept.best_match(handler_types)
     tx.response.headers.content_type = best_match
+    tx.response.variants = handler_types
     return dict(handlers)[best_match](*args, **kwargs)
 
 
@@ -626,27 +745,182 @@ class Resource:
 # XXX         return self[key]
 
 
+job_schema = Schema(tables=dict(
+    job_signatures="""module TEXT, object TEXT, args BLOB,
+                      kwargs BLOB, arghash TEXT,
+                      UNIQUE(module, object, arghash)""",
+    job_runs="""job_signature_id INTEGER,
+                job_id TEXT UNIQUE,
+                created DATETIME NOT NULL
+                  DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f',
+                                   'NOW')),
+                due DATETIME, started DATETIME, finished DATETIME,
+                start_time REAL, run_time REAL,
+                status INTEGER, output TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3""",
+    job_schedules="""job_signature_id INTEGER, minute TEXT,
+                     hour TEXT, day_of_month TEXT,
+                     month TEXT, day_of_week TEXT,
+                     last_fired DATETIME,
+                     UNIQUE(job_signature_id, minute,
+                            hour, day_of_month, month,
+                            day_of_week)"""),
+    indexes=dict(job_runs_signature="job_runs (job_signature_id)"))
+session_schema = Schema(tables=dict(
+    sessions="""timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                identifier TEXT NOT NULL UNIQUE,
+                data TEXT NOT NULL"""),
+    indexes=dict(sessions_timestamp="sessions (timestamp)"))
+
+
+def get_db_pool(identifier):
+    """return this process's pool of handles on an app's database"""
+    pool = db_pools.get(identifier)
+    if pool is None or pool.pid != os.getpid():
+        if pool is not None:
+            # never close connections inherited across a fork as doing
+            # so would disturb the parent's locks
+            stale_db_pools.append(pool)
+        pool = db_pools[identifier] = Pool(f"web-{identifier}.db",
+                                           size=db_pool_size)
+        migrate(pool.shared, job_schema)
+    return pool
+
+
 def get_app_db(identifier):
-    """"""
-    db = sql.db(f"web-{identifier}.db")
-    db.define(job_signatures="""module TEXT, object TEXT, args BLOB,
-                                kwargs BLOB, arghash TEXT,
-                                UNIQUE(module, object, arghash)""",
-              job_runs="""job_signature_id INTEGER,
-                          job_id TEXT UNIQUE,
-                          created DATETIME NOT NULL
-                            DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f',
-                                             'NOW')),
-                          started DATETIME, finished DATETIME,
-                          start_time REAL, run_time REAL,
-                          status INTEGER, output TEXT""",
-              job_schedules="""job_signature_id INTEGER, minute TEXT,
-                               hour TEXT, day_of_month TEXT,
-                               month TEXT, day_of_week TEXT,
-                               UNIQUE(job_signature_id, minute,
-                                      hour, day_of_month, month,
-                                      day_of_week)""")
-    return db
+    """return the current greenlet's handle on an app's database"""
+    return get_db_pool(identifier).db
+
+
+class ResourceNotFound(Resource):
+
+    """the resource dispatched to when no route matches the request path"""
+
+    def _get(self):
+        raise NotFound("Resource not found")
+
+
+class Router:
+
+    """
+    a precompiled dispatcher for an application's mounts and routes
+
+    Mount prefixes are folded into a single alternation. Routes are
+    bucketed by their literal first path segment and each bucket is folded
+    into its own alternation (routes without a literal first segment join
+    every bucket) so dispatch cost stays flat as routes are added. Named
+    groups are renamed per entry so that routes may share path arguments.
+    Resolutions are memoized per path.
+
+        >>> router = Router()
+        >>> router.add_route(r"people/(?P<name>[a-z]+)", "Person")
+        >>> router.resolve("people/alice")
+        ('Person', {'name': 'alice'}, {})
+
+    """
+
+    _group_re = re.compile(r"\(\?P([<=])(\w+)")
+    _meta_re = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+    def __init__(self, cache_size=4096):
+        self.mounts = []
+        self.routes = []
+        self.parents = []
+        self.resolve = functools.lru_cache(cache_size)(self._resolve)
+        self.reset()
+
+    def add_mount(self, pattern, app):
+        """register a mounted `app` to handle paths beginning `pattern`"""
+        self.mounts.append((pattern, app))
+        app.router.parents.append(self)
+        self.reset()
+
+    def add_route(self, pattern, resource):
+        """register a `resource` to handle paths matching `pattern`"""
+        self.routes.append((pattern, resource))
+        self.reset()
+
+    def reset(self):
+        """discard the compiled patterns and memoized resolutions"""
+        self._mounts = None
+        self._buckets = None
+        self._wildcards = None
+        self.resolve.cache_clear()
+        for parent in self.parents:
+            parent.reset()
+
+    def compile(self):
+        """fold the registered patterns into their alternations"""
+        self._mounts = self._combine(self.mounts, r"(?:{})")
+        heads = [self._get_head(pattern) for pattern, _ in self.routes]
+        self._buckets = {}
+        for head in set(heads) - {None}:
+            entries = [route for route, route_head in zip(self.routes, heads)
+                       if route_head in (head, None)]
+            self._buckets[head] = self._combine(entries, r"^(?:{})$")
+        self._wildcards = self._combine([route for route, route_head
+                                         in zip(self.routes, heads)
+                                         if route_head is None], r"^(?:{})$")
+
+    def _get_head(self, pattern):
+        """return the literal first segment of `pattern` if it has one"""
+        head = pattern.partition("/")[0]
+        if "|" in pattern or self._meta_re.search(head):
+            return None
+        return head
+
+    def _combine(self, entries, template):
+        alternatives = []
+        targets = {}
+        for index, (pattern, target) in enumerate(entries):
+            prefix = f"_{index}_"
+            names = {}
+
+            def rename(match):
+                names[prefix + match.group(2)] = match.group(2)
+                return f"(?P{match.group(1)}{prefix}{match.group(2)}"
+
+            pattern = self._group_re.sub(rename, pattern)
+            alternatives.append(f"(?P<_{index}>{pattern})")
+            targets[f"_{index}"] = target, names
+        if not alternatives:
+            return None, targets
+        return re.compile(template.format("|".join(alternatives))), targets
+
+    def _resolve(self, path):
+        """
+        return the resource, its path arguments and any mount arguments
+
+        """
+        # TODO softcode `static/` reference
+        if path.endswith("/") and not path.startswith("static/"):
+            raise PermanentRedirect("/" + path.rstrip("/"))
+        if self._mounts is None:
+            self.compile()
+
+        mount_re, mounts = self._mounts
+        if mount_re:
+            match = mount_re.match(path)
+            if match:
+                app, names = mounts[match.lastgroup]
+                resource, args, mount_args = \
+                    app.router.resolve(path[match.end():].lstrip("/"))
+                mount_args = dict(mount_args, **{name: match.group(group)
+                                                 for group, name
+                                                 in names.items()})
+                return resource, args, mount_args
+
+        path = urllib.parse.unquote(path)
+        route_re, routes = self._buckets.get(path.partition("/")[0],
+                                             self._wildcards)
+        match = route_re.match(path) if route_re else None
+        if not match:
+            return ResourceNotFound, {}, {}
+        resource, names = routes[match.lastgroup]
+        args = {name: urllib.parse.unquote(match.group(group))
+                for group, name in names.items() if match.group(group)}
+        return resource, args, {}
 
 
 class Application:
@@ -671,8 +945,12 @@ class Application:
     """
 
     def __init__(self, name, *wrappers, host=None, static=None, icon=None,
-                 sessions=True, serve=False, **path_args):
+                 sessions=True, compress=True, max_body_size=2**26,
+                 auto_etags=False, page_cache=True, serve=False,
+                 **path_args):
         self.name = name
+        self.max_body_size = max_body_size
+        self.auto_etags = auto_etags
         self.wrappers = []
         self.pre_wrappers = []
         self.post_wrappers = []
@@ -680,11 +958,9 @@ class Application:
         self.host = host
         self.path_args = {}
         self.add_path_args(**path_args)
-        self.mounts = []
-        self.routes = []  # TODO use ordered dict
+        self.router = Router()
         self.cache = cache()
 
-        self.db = get_app_db(name)
         class Database:
             def _get(innerself):
                 return tx.db.tables
@@ -697,14 +973,26 @@ class Application:
 
         self.kv = kv.db("web", ":", {"jobqueue": "list"},
                         socket="web-redis.sock")
+        self.compressor = Compressor() if compress else None
+        self.pages = None
+        if page_cache:
+            self.pages = PageCache(LocalBackend(local_ttl=5),
+                                   KVBackend(self.kv.db))
+        asset_roots = [pathlib.Path(__file__).parent / "static"]
         if static:
             static_path = pkg_resources.resource_filename(static, "static")
             self.static_path = pathlib.Path(static_path)
-        if sessions:
-            self.db.define(sessions="""timestamp DATETIME NOT NULL
-                                           DEFAULT CURRENT_TIMESTAMP,
-                                       identifier TEXT NOT NULL UNIQUE,
-                                       data TEXT NOT NULL""")
+            asset_roots.insert(0, self.static_path)
+        self.assets = AssetServer(*asset_roots, compressor=self.compressor)
+        if sessions == "kv":  # NOTE shared by every node behind the balancer
+            self.session_store = KVSessionStore(self.kv.db,
+                                                encode=JSONEncoder().encode)
+            self.wrap(resume_session, "pre")
+        elif sessions:
+            migrate(self.db, session_schema)
+            self.session_store = DatabaseSessionStore(
+                functools.partial(get_app_db, self.name),
+                encode=JSONEncoder().encode)
             self.wrap(resume_session, "pre")
         # for method in http.spec.request.methods[:5]:
         #     setattr(self, method, functools.partial(self.get_handler,
@@ -719,12 +1007,8 @@ class Application:
         if icon:
             def insert_icon_rels(handler, app):
                 yield
-                if tx.response.status == "200 OK" and \
-                   tx.response.headers.content_type == "text/html":
-                    doc = parse(tx.response.body)
-                    head = doc.select("head")[0]
-                    head.append("<link rel=icon href=/icon.png>")
-                    tx.response.body = doc.html
+                if tx.response.status == "200 OK":
+                    head_link("icon", "/icon.png", add_header=False)
             self.wrap(insert_icon_rels, "post")
 
             if str(icon).endswith("="):  # TODO better test for b64
@@ -778,9 +1062,25 @@ class Application:
         except (FileNotFoundError, TypeError):
             pass
 
+    @property
+    def db_pool(self):
+        return get_db_pool(self.name)
+
+    @property
+    def db(self):
+        return get_app_db(self.name)
+
     def add_wrappers(self, *wrappers):
+        for wrapper in wrappers:
+            self.add_schema(wrapper)
         self.wrappers.extend(wrappers)
 
+    def add_schema(self, hook):
+        """apply the schema (if any) that wrapper `hook` relies upon"""
+        hook_schema = getattr(hook, "schema", None)
+        if hook_schema is not None:
+            migrate(self.db, hook_schema)
+
     def add_path_args(self, **path_args):
         self.path_args.update({k: v.replace(r"\!", nb60_re)
                                for k, v in path_args.items()})
@@ -823,6 +1123,7 @@ class Application:
         decorate a generator to run at various stages during the request
 
         """
+        self.add_schema(handler)
         if when == "pre":
             self.pre_wrappers.append(handler)
         elif when == "post":
@@ -880,7 +1181,7 @@ class Application:
                 path = "/".join((self.prefix, path))
             except AttributeError:
                 pass
-            self.routes.append((path.strip("/"), Route))
+            self.router.add_route(path.strip("/"), Route)
             return Route
         return register
 
@@ -894,7 +1195,15 @@ class Application:
             self.add_wrappers(*app.wrappers)  # TODO add pre and post wrappers
             path = app.mount_prefix.format(**{k: "(?P<{}>{})".format(k, v) for
                                               k, v in self.path_args.items()})
-            self.mounts.append((path, app))
+            self.router.add_mount(path, app)
+
+    @property
+    def mounts(self):
+        return self.router.mounts
+
+    @property
+    def routes(self):
+        return self.router.routes
 
     def __repr__(self):
         return "<web.application: {}>".format(self.name)
@@ -913,31 +1222,12 @@ class Application:
 
     def __call__(self, environ, start_response):
         """The WSGI callable."""
-        tx.request._contextualize(environ)
+        tx.request._contextualize(environ, self.max_body_size)
         tx.response._contextualize()
         path = tx.request.uri.path
 
         if path.startswith("static/"):
-            asset_path = path.partition("/")[2]
-            if asset_path.startswith((".", "/")):
-                raise BadRequest("bad filename")
-            asset = self.static_path / asset_path
-            try:
-                with asset.open() as fp:
-                    content = fp.read()
-            except FileNotFoundError:
-                asset = pathlib.Path(__file__).parent / "static" / asset_path
-                try:
-                    with asset.open() as fp:
-                        content = fp.read()
-                except FileNotFoundError:
-                    raise NotFound("file not found")
-            content_types = {".css": "text/css",
-                             ".js": "application/javascript"}
-            # tx.response.headers.content_type = content_types[asset.suffix]
-            header("Content-Type", content_types[asset.suffix])
-            start_response("200 OK", tx.response.headers.wsgi)
-            return [bytes(content, "utf-8")]
+            return self.assets(environ, start_response, path.partition("/")[2])
 
         try:
             tx.host._contextualize(self, tx.request.headers.host.name,
@@ -949,6 +1239,7 @@ class Application:
         tx.response.headers.content_type = "text/plain"
         # XXX tx.app_name = self.name
         response_hooks = []
+        page_key = None
 
         def exhaust_hooks():
             for hook in response_hooks:
@@ -959,6 +1250,11 @@ class Application:
 
         try:
             tx.request.controller = self.get_controller(path)
+            page_key = self.get_page_key(environ)
+            if page_key:
+                page = self.get_page(*page_key)
+                if page:
+                    return self.replay(page, start_response)
 
             for hook in self.pre_wrappers + self.wrappers + self.post_wrappers:
                 if not inspect.isgeneratorfunction(hook):
@@ -998,11 +1294,14 @@ class Application:
                     raise OK(b"")
 
             tx.response.status = "200 OK"
-            if method == "GET":
-                forced_method = Form().get("_http_method")
+            if method == "GET" and "_http_method" in environ.get(
+                    "QUERY_STRING", ""):
+                forced_method = tx.request.body.get("_http_method")
                 if forced_method:
                     method = forced_method.upper()
 
+            if method in ("GET", "HEAD"):
+                self.check_validators(tx.request.controller)
             tx.request.controller.get_data()
             body = self.get_handler(tx.request.controller, method)()
             if body is None:
@@ -1053,17 +1352,235 @@ class Application:
             header("Content-Type", tx.response.body.content_type)
         except AttributeError:
             pass
+        buffer = (page_key is not None and
+                  tx.response.status.startswith("200")) or self.wants_etag()
+        body, size = self.serialize(tx.response.body, environ, buffer)
+        if tx.response.head and self.is_html():
+            if size is None:
+                body = splice_head_stream(body, tx.response.head)
+            else:
+                body = [splice_head(b"".join(body), tx.response.head)]
+                size = len(body[0])
+        if size is not None:
+            body = self.validate(body)
+        body = self.compress(body, size)
+        if (page_key and size is not None and
+                tx.response.status.startswith("200")):
+            body = [b"".join(body)]
+            self.store_page(body[0], *page_key)
+        if tx.request.method == "HEAD":
+            body = []
         try:
             start_response(tx.response.status, tx.response.headers.wsgi)
         except OSError:  # websocket connection broken
             # TODO close websocket connection?
             return []
-        if isinstance(tx.response.body, bytes):
-            return [tx.response.body]
-        elif tx.response.headers.get("content-type") == "application/json":
+        return body
+
+    def serialize(self, body, environ, buffer=False):
+        """
+        return response `body` as an iterable of bytes and its size in bytes
+
+        Generators, iterators and file objects are passed through chunk by
+        chunk rather than materialized; their size is None. Template
+        results are streamed likewise unless `buffer` is set for a response
+        that is to be validated or cached.
+
+        """
+        if isinstance(body, bytes):
+            return [body], len(body)
+        if tx.response.headers.get("content-type") == "application/json":
             # XXX return [bytes(json.dumps(tx.response.body), "utf-8")]
-            return [bytes(JSONEncoder().encode(tx.response.body), "utf-8")]
-        return [bytes(str(tx.response.body), "utf-8")]
+            payload = bytes(JSONEncoder().encode(body), "utf-8")
+            return [payload], len(payload)
+        if isinstance(body, TemplateResult):
+            chunks = rechunk(body.stream())
+            if not buffer:
+                return chunks, None
+            payload = b"".join(chunks)
+            return [payload], len(payload)
+        if hasattr(body, "read"):
+            file_wrapper = environ.get("wsgi.file_wrapper",
+                                       wsgiref.util.FileWrapper)
+            return file_wrapper(body, default_chunk_size), None
+        if isinstance(body, collections.abc.Iterator):
+            return (bytes(chunk, "utf-8") if isinstance(chunk, str) else chunk
+                    for chunk in body), None
+        payload = bytes(str(body), "utf-8")
+        return [payload], len(payload)
+
+    def get_page_key(self, environ):
+        """
+        return where the page cache may hold this request's response or None
+
+        Route classes opt in with a `cache_ttl` in seconds. Requests that
+        carry a session cookie bypass the cache unless the route sets
+        `cache_sessions = "segment"` to cache separately per session.
+
+        """
+        if self.pages is None or tx.request.method not in ("GET", "HEAD"):
+            return None
+        controller = tx.request.controller
+        ttl = getattr(controller, "cache_ttl", None)
+        if not ttl:
+            return None
+        segment = ""
+        cookie = tx.request.headers.get("cookie")
+        session = cookie.get("session") if cookie is not None else None
+        if session:
+            if getattr(controller, "cache_sessions", "bypass") != "segment":
+                return None
+            segment = session
+        encoding = ""
+        if self.compressor:
+            accept_encoding = tx.request.headers.get("accept-encoding")
+            encoding = self.compressor.negotiate(accept_encoding) or ""
+        resource = PageCache.get_resource(tx.host.name, tx.request.uri.path)
+        return (resource, environ.get("QUERY_STRING", ""), encoding, segment,
+                ttl)
+
+    def get_page(self, resource, query, encoding, segment, ttl):
+        """return the cached `pagecache.Page` for given key if any"""
+        variant = ""
+        variants = self.pages.get(resource, "variants")
+        if variants:
+            accept = tx.request.headers.get("accept") or \
+                     headers.request.Accept("*/*")
+            variant = accept.best_match(variants)
+        field = PageCache.get_field(query, variant, encoding, segment)
+        return self.pages.get(resource, field)
+
+    def store_page(self, payload, resource, query, encoding, segment, ttl):
+        """cache the current response under given key"""
+        variant = ""
+        if tx.response.variants:
+            self.pages.set(resource, "variants", tx.response.variants, ttl)
+            variant = str(tx.response.headers.content_type)
+        field = PageCache.get_field(query, variant, encoding, segment)
+        response_headers = [(name, value) for name, value
+                            in tx.response.headers.wsgi
+                            if name.lower() != "set-cookie"]
+        page = Page(tx.response.status, response_headers, payload,
+                    time.time() + ttl)
+        self.pages.set(resource, field, page, ttl)
+
+    def replay(self, page, start_response):
+        """respond with a cached `page`"""
+        etag = dict((name.lower(), value)
+                    for name, value in page.headers).get("etag")
+        if_none_match = tx.request.headers.get("if-none-match")
+        if etag and if_none_match is not None and \
+                etag_matches(etag, str(if_none_match)):
+            start_response("304 Not Modified", page.headers)
+            return []
+        start_response(page.status, page.headers)
+        if tx.request.method == "HEAD":
+            return []
+        return [page.body]
+
+    def check_validators(self, controller):
+        """
+        raise `NotModified` if the client's copy of `controller` is fresh
+
+        Route classes may define cheap `_etag` and `_last_modified` methods
+        (returning a tag and a datetime or timestamp respectively) that are
+        evaluated before any data is loaded or rendered.
+
+        """
+        etag = last_modified = None
+        if hasattr(controller, "_etag"):
+            etag = controller._etag()
+        if hasattr(controller, "_last_modified"):
+            last_modified = controller._last_modified()
+        if etag is not None:
+            etag = str(etag)
+            if not etag.endswith('"'):
+                etag = f'W/"{etag}"'
+            tx.response.headers.etag = etag
+        if last_modified is not None:
+            if isinstance(last_modified, datetime.datetime):
+                if last_modified.tzinfo is None:
+                    last_modified = last_modified.replace(
+                        tzinfo=datetime.timezone.utc)
+                last_modified = last_modified.timestamp()
+            header("Last-Modified",
+                   email.utils.formatdate(last_modified, usegmt=True))
+        if_none_match = tx.request.headers.get("if-none-match")
+        if_modified_since = tx.request.headers.get("if-modified-since")
+        if if_none_match is not None:
+            fresh = etag is not None and etag_matches(etag, str(if_none_match))
+        elif if_modified_since is not None and last_modified is not None:
+            fresh = not_modified_since(last_modified, str(if_modified_since))
+        else:
+            fresh = False
+        if fresh:
+            raise NotModified("")
+
+    def validate(self, body):
+        """
+        return `body` or an empty body if the client's copy is still fresh
+
+        Successful GET and HEAD responses to routes that opt in (via the
+        `auto_etags` application argument or an `auto_etag` attribute on the
+        route class) are given a weak `ETag` hashed from the body.
+
+        """
+        if not self.wants_etag():
+            return body
+        digest = hashlib.blake2b(digest_size=12)
+        for chunk in body:
+            digest.update(chunk)
+        etag = f'W/"{digest.hexdigest()}"'
+        tx.response.headers.etag = etag
+        if_none_match = tx.request.headers.get("if-none-match")
+        if if_none_match is not None and etag_matches(etag,
+                                                      str(if_none_match)):
+            tx.response.status = "304 Not Modified"
+            return []
+        return body
+
+    def wants_etag(self):
+        """return True if the response is to be given a weak `ETag`"""
+        return (tx.request.method in ("GET", "HEAD") and
+                tx.response.status.startswith("200") and
+                bool(getattr(tx.request.controller, "auto_etag",
+                             self.auto_etags)) and
+                "etag" not in tx.response.headers)
+
+    def is_html(self):
+        """return True if the response is an HTML document"""
+        content_type = str(tx.response.headers.get("content-type", ""))
+        return content_type.partition(";")[0].strip() == "text/html"
+
+    def compress(self, body, size=None):
+        """
+        return iterable `body` compressed as negotiated with the client
+
+        Bodies that are already encoded, not worth compressing or known to
+        be smaller than the compressor's threshold are returned as is.
+
+        """
+        if self.compressor is None:
+            return body
+        content_type = tx.response.headers.get("content-type", "text/plain")
+        if ("content-encoding" in tx.response.headers or
+                not is_compressible(content_type)):
+            return body
+        vary = tx.response.headers.get("vary")
+        if vary is None:
+            header("Vary", "Accept-Encoding")
+        elif "accept-encoding" not in str(vary).lower():
+            header("Vary", f"{vary}, Accept-Encoding")
+        if tx.response.status.startswith(("204", "304")):
+            return body
+        if size is not None and size < self.compressor.threshold:
+            return body
+        accept_encoding = tx.request.headers.get("accept-encoding")
+        encoding = self.compressor.negotiate(accept_encoding)
+        if encoding is None:
+            return body
+        header("Content-Encoding", encoding)
+        return self.compressor.compress(body, encoding)
 
     # def __gevent_call__(self, environ, start_response):
     #     """gevent's WSGI callable."""
@@ -1085,46 +1602,14 @@ class Application:
 
     def get_controller(self, path):
         """
+        return an instance of the resource routed to by `path`
 
         """
-        # TODO softcode `static/` reference
-        if path.endswith("/") and not path.startswith("static/"):
-            raise PermanentRedirect("/" + path.rstrip("/"))
-
-        for mount, app in self.mounts:
-            m = re.match(mount, path)
-            if m:
-                controller = app.get_controller(path[m.span()[1]:].lstrip("/"))
-                for k, v in m.groupdict().items():
-                    setattr(controller, k, v)
-                return controller
-
-        class ResourceNotFound(Resource):
-            def _get(inner_self):
-                raise NotFound("Resource not found")
-                error = self.view.error
-                # TODO recursively ascend app ancestors
-                # try:
-                #     error = self.parent_app.view.error
-                # except AttributeError:
-                #     error = self.parent_app.parent_app.view.error
-                raise NotFound(error.resource_not_found())
-
-        def get_resource():
-            for pattern, resource in self.routes:
-                if isinstance(resource, str):
-                    mod = __import__(resource.__module__)
-                    resource = getattr(mod, resource)
-                match = re.match(r"^{}$".format(pattern),
-                                 urllib.parse.unquote(path))
-                if match:
-                    return resource, match
-            return ResourceNotFound, None
-
-        resource, match = get_resource()  # TODO for-else or try-block instead?
-        unquoted = {k: urllib.parse.unquote(v) for k, v
-                    in match.groupdict().items() if v} if match else {}
-        return resource(**unquoted)
+        resource, args, mount_args = self.router.resolve(path)
+        controller = resource(**args)
+        for k, v in mount_args.items():
+            setattr(controller, k, v)
+        return controller
 
     def get_handler(self, controller, method="get"):
         method = f"_{method.lower()}"
@@ -1191,7 +1676,7 @@ class User(Context):
 
 class Request(Context):
 
-    def _contextualize(self, environ):
+    def _contextualize(self, environ, max_body_size=None):
         self.uri = uri.parse(wsgiref.util.request_uri(environ,
                                                       include_query=1))
         self.method = environ.get("REQUEST_METHOD").upper()
@@ -1204,7 +1689,7 @@ class Request(Context):
         elif self.method in ("PUT",):
             self.body = environ["wsgi.input"].read()
         else:
-            self.body = RequestBody(environ)
+            self.body = RequestBody(environ, max_body_size)
 
     def __getitem__(self, name):
         return self.body[name]  # XXX .value
@@ -1212,26 +1697,90 @@ class Request(Context):
 
 class RequestBody:
 
-    def __init__(self, environ):
-        raw_data = environ["wsgi.input"].read()
+    """
+    the request body, parsed on first access according to its content type
+
+    JSON becomes a `dict`, urlencoded and multipart forms become a
+    `multipart.FormData` (merged with the query string) and anything else
+    is left as text. As with `cgi`, a body without a content type that
+    isn't JSON is taken to be urlencoded. Bodies larger than `max_size`
+    bytes are refused.
+
+    """
+
+    def __init__(self, environ, max_size=None):
+        self.environ = environ
+        self.max_size = max_size
+
+    def read(self):
+        """return the raw bytes of the body"""
+        return b"".join(self.chunks())
+
+    def chunks(self):
+        """yield the raw body in chunks"""
+        length = self.environ.get("CONTENT_LENGTH")
+        if length:
+            try:
+                length = int(length)
+            except ValueError:
+                raise BadRequest("invalid `Content-Length`")
+        elif self.environ.get("wsgi.input_terminated"):
+            length = None  # NOTE chunked transfer-encoding
+        else:
+            return
         try:
+            yield from multipart.read_chunks(self.environ["wsgi.input"],
+                                             length, self.max_size)
+        except multipart.BodyTooLarge as err:
+            raise RequestEntityTooLarge(str(err))
+
+    @functools.cached_property
+    def _data(self):
+        query = self.environ.get("QUERY_STRING", "")
+        content_type = self.environ.get("CONTENT_TYPE", "")
+        media_type, _, params = content_type.partition(";")
+        media_type = media_type.strip().lower()
+        if media_type == "multipart/form-data":
+            boundary = None
+            for param in params.split(";"):
+                name, _, value = param.partition("=")
+                if name.strip().lower() == "boundary":
+                    boundary = value.strip().strip('"')
+            if not boundary:
+                raise BadRequest("multipart body has no boundary")
+            form = multipart.parse_urlencoded(query)
             try:
-                data = raw_data.decode("utf-8")
-            except (AttributeError, UnicodeDecodeError):
-                data = raw_data
-            data = json.loads(data)
-        except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+                return multipart.parse_multipart(self.chunks(), boundary,
+                                                 form)
+            except multipart.MalformedBody as err:
+                raise BadRequest(str(err))
+        raw_data = self.read()
+        if media_type == "application/x-www-form-urlencoded":
+            form = multipart.parse_urlencoded(query)
+            return multipart.parse_urlencoded(raw_data.decode("latin-1"),
+                                              form)
+        if not raw_data:
+            return multipart.parse_urlencoded(query)
+        if not media_type:
             try:
-                environ["wsgi.input"] = io.BytesIO(raw_data)
-                data = cgi.FieldStorage(fp=environ["wsgi.input"],
-                                        environ=environ,
-                                        keep_blank_values=True)
-            except TypeError:
-                try:
-                    data = raw_data.decode("utf-8")
-                except AttributeError:
-                    data = raw_data
-        self._data = data
+                return json.loads(raw_data.decode("utf-8"))
+            except (UnicodeDecodeError, json.decoder.JSONDecodeError):
+                form = multipart.parse_urlencoded(query)
+                return multipart.parse_urlencoded(raw_data.decode("latin-1"),
+                                                  form)
+        try:
+            data = raw_data.decode("utf-8")
+        except UnicodeDecodeError:
+            return raw_data
+        if media_type == "application/json" or media_type.endswith("+json"):
+            try:
+                return json.loads(data)
+            except json.decoder.JSONDecodeError:
+                raise BadRequest("malformed JSON")
+        try:
+            return json.loads(data)
+        except json.decoder.JSONDecodeError:
+            return data
 
     def items(self):
         return {k: self[k] for k in self._data.keys()}
@@ -1252,6 +1801,8 @@ class Response(Context):
 
     def _contextualize(self):
         self.headers = headers.Headers()
+        self.head = []
+        self.variants = None
         self.body = ""
         self.naked = False
 
@@ -1291,7 +1842,7 @@ class Transaction:
 
     @property
     def cache(self):
-        return self.host.cache
+        return self.host.app.cache
 
     @property
     def db(self):
@@ -1318,85 +1869,95 @@ tx = Transaction()
 
 def sessions(**defaults):
     """
-    returns an application hook for session handling using given redis `db`
+    returns an application hook for session handling using the shared kv
+
+    A request costs at most one pipelined round trip to load its session
+    and one more to save it when it was modified.
 
     """
+    store = KVSessionStore(kvdb.db, encode=JSONEncoder().encode)
+
     def hook(handler, app):
+        store.start(app.cfg["session"].get("timeout",
+                                           default_session_timeout))
         try:
             identifier = tx.request.headers["cookie"].morsels["session"]
         except KeyError:
-            identifier = 0
-        if ("sessions", identifier) not in kvdb:
-            while True:
-                secret = "{}{}{}{}".format(random.getrandbits(128),
-                                           app.cfg["session"]["salt"],
-                                           time.time(), tx.user.ip)
-                secret_hash = hashlib.sha256(secret.encode("utf-8"))
-                identifier = secret_hash.hexdigest()
-                if kvdb["sessions", identifier].setnx("anonymous"):
-                    break
-        session_timeout = app.cfg["session"].get("timeout",
-                                                 default_session_timeout)
-        kvdb["sessions", identifier].expire(session_timeout)
-        # FIXME user.session = kvdb.hgetall(kvdb(user.identifier, "data"))
-        data = kvdb["sessions", identifier, "data"]
-        if data:
-            data = json.loads(str(data))
+            identifier = None
+        data = store.load(identifier) if identifier else None
+        if data is None:
+            secret = "{}{}{}{}".format(random.getrandbits(128),
+                                       app.cfg["session"]["salt"],
+                                       time.time(), tx.user.ip)
+            secret_hash = hashlib.sha256(secret.encode("utf-8"))
+            identifier = secret_hash.hexdigest()
+            data, loaded = dict(defaults), None
         else:
-            data = Session(defaults)
-        # XXX print(identifier, data)
+            loaded = store.encode(data)
         tx.user.session = data
         tx.user.identifier = identifier
         yield
-        kvdb["sessions", identifier, "data"] = \
-            JSONEncoder().encode(tx.user.session)
-        kvdb["sessions", identifier, "data"].expire(session_timeout)
-        # FIXME kvdb.delete("data")
-        # FIXME if user.session:
-        # FIXME     kvdb.hmset("data", **user.session)
-        # XXX print(identifier, data, tx.user.identifier, tx.user.session)
+        payload = store.encode(tx.user.session)
+        if payload != loaded:
+            store.save(identifier, payload)
+        else:
+            store.touch(identifier)
         tx.response.headers["set-cookie"] = (("session", tx.user.identifier),)
         # ("Domain", tx.host.name))
     return hook
 
 
 def resume_session(handler, app):
-    """."""
-    # TODO monitor expiration (default_session_timeout)
-    data = {}
+    """
+    resume the session named in the request's cookie
+
+    The session is only written back when its encoding differs from that
+    it was resumed with, so changes made inside nested values are saved.
+    A session emptied or replaced with None is deleted along with its
+    cookie.
+
+    """
+    store = app.session_store
+    try:
+        timeout = app.cfg["session"]["timeout"]
+    except (AttributeError, KeyError, TypeError):
+        timeout = default_session_timeout
+    store.start(timeout)
+    data = None
     try:
         identifier = tx.request.headers["cookie"].morsels["session"]
     except KeyError:
-        identifier = None
+        identifier = cookie = None
     else:
-        try:
-            session = app.db.select("sessions", where="identifier = ?",
-                                    vals=[identifier])[0]
-        except IndexError:
+        cookie = identifier
+        data = store.load(identifier)
+        if data is None:
             identifier = None
-        else:
-            try:
-                data = json.loads(session["data"])
-            except json.decoder.JSONDecodeError:
-                identifier = None
-    tx.user.session = data
+    loaded = store.encode(data) if data else None
+    tx.user.session = data or {}
     yield
-    if tx.user.session:
+    session = tx.user.session
+    if session:
         if identifier is None:
             salt = "abcdefg"  # FIXME
             secret = f"{random.getrandbits(64)}{salt}{time.time()}{tx.user.ip}"
             identifier = hashlib.sha256(secret.encode("utf-8")).hexdigest()
-            tx.user.session.update(ip=tx.user.ip,
-                                   ua=str(tx.request.headers["user-agent"]))
+            session.update(ip=tx.user.ip,
+                           ua=str(tx.request.headers.get("user-agent")))
             # TODO FIXME add Secure for HTTPS sites (eg. canopy)!
             tx.response.headers["set-cookie"] = (("session", identifier),
                                                  ("path", "/"),
                                                  # "Secure",
                                                  "HttpOnly")
-        app.db.replace("sessions", identifier=identifier,
-                       data=JSONEncoder().encode(tx.user.session))
-    else:
-        tx.response.headers["set-cookie"] = (("session", identifier),
+        payload = store.encode(session)
+        if payload != loaded:
+            store.save(identifier, payload)
+        else:
+            store.touch(identifier)
+    elif cookie is not None:
+        if identifier is not None:
+            store.delete(identifier)
+        tx.response.headers["set-cookie"] = (("session", cookie),
                                              ("path", "/"), ("max-age", 0))
 
 
@@ -1441,17 +2002,140 @@ def kill_redis(socket):
     sh.redis_cli("-s", socket, "shutdown")
 
 
+def get_job_queue_key(lane):
+    """return the kv key of the job queue for priority `lane`"""
+    if lane not in job_lanes:
+        raise ValueError(f"unknown job lane `{lane}`, use one of {job_lanes}")
+    return f"web:jobqueue:{lane}"
+
+
 def enqueue(callable, *args, **kwargs):
     """
     append a function call to the end of the job queue
 
+    The call joins the queue of the callable's `lane` attribute (default
+    "default"). A failing call is retried up to the callable's
+    `max_attempts` attribute (default 3) times in all. When the callable
+    has a `coalesce` attribute the call joins an identical run that is
+    pending (and was due or created less than `stale_run_timeout` seconds
+    ago) or that succeeded less than `coalesce` seconds ago, if any.
+
+    Returns the job id.
+
+    """
+    return enqueue_many([(callable, args, kwargs)])[0]
+
+
+def enqueue_many(calls):
+    """
+    enqueue each `(callable, args, kwargs)` of `calls` and return job ids
+
+    """
+    return queue_runs(tx.app.name, tx.app.kv.db, calls)
+
+
+def enqueue_at(due, callable, *args, **kwargs):
     """
-    job_signature_id = get_job_signature(callable, *args, **kwargs)
-    job_run_id = nbrandom(9)
-    tx.app.db.insert("job_runs", job_signature_id=job_signature_id,
-                     job_id=job_run_id)
+    enqueue a function call to run once `due`, an aware datetime, passes
+
+    Returns the job id.
+
+    """
+    return queue_runs(tx.app.name, tx.app.kv.db, [(callable, args, kwargs)],
+                      due=pendulum.instance(due))[0]
+
+
+def enqueue_in(delay, callable, *args, **kwargs):
+    """
+    enqueue a function call to run after `delay` seconds or timedelta
+
+    Returns the job id.
+
+    """
+    if isinstance(delay, datetime.timedelta):
+        delay = delay.total_seconds()
+    return enqueue_at(utcnow().add(seconds=delay), callable, *args, **kwargs)
+
+
+def delay_jobs(redis, queue_key, entries, due):
+    """hold `entries` for queue `queue_key` in the delayed set until `due`"""
+    redis.zadd(delayed_jobs_key, {f"{queue_key} {entry}": due.timestamp()
+                                  for entry in entries})
+
+
+def queue_runs(app_name, redis, calls, due=None):
+    """
+    record runs of `calls` in one transaction and queue them in one trip
+
+    Runs `due` in the future wait in the delayed set until promoted.
+
+    """
+    calls = [(callable, get_job_queue_key(getattr(callable, "lane",
+                                                  "default")), args, kwargs)
+             for callable, args, kwargs in calls]
+
+    def insert_runs(cur):
+        job_run_ids = []
+        queued = collections.defaultdict(list)
+        for callable, queue_key, args, kwargs in calls:
+            job_signature_id = find_job_signature(cur, callable, args, kwargs)
+            window = getattr(callable, "coalesce", None)
+            if window is not None:
+                now = utcnow()
+                runs = cur.select("job_runs", what="job_id",
+                                  where="""job_signature_id = ? AND
+                                           ((finished IS NULL AND
+                                             COALESCE(due, created) > ?) OR
+                                            (status = 0 AND
+                                             finished > ?))""",
+                                  vals=[job_signature_id,
+                                        now.subtract(
+                                            seconds=stale_run_timeout),
+                                        now.subtract(seconds=window)],
+                                  order="rowid DESC", limit=1)
+                if runs:
+                    job_run_ids.append(runs[0]["job_id"])
+                    continue
+            job_run_id = nbrandom(9)
+            cur.insert("job_runs", job_signature_id=job_signature_id,
+                       job_id=job_run_id, due=due,
+                       max_attempts=getattr(callable, "max_attempts", 3))
+            job_run_ids.append(job_run_id)
+            job_type = f"{callable.__module__}.{callable.__name__}"
+            queued[queue_key].append(f"{app_name}:{job_run_id}:{job_type}")
+        return job_run_ids, queued
+
+    job_run_ids, queued = get_db_pool(app_name).write(insert_runs)
     # TODO add a "seen" column
-    tx.app.kv["jobqueue"].append(f"{tx.app.name}:{job_run_id}")
+    if queued:
+        pipeline = redis.pipeline(transaction=False)
+        for queue_key, entries in queued.items():
+            if due is not None and due > utcnow():
+                delay_jobs(pipeline, queue_key, entries, due)
+            else:
+                pipeline.rpush(queue_key, *entries)
+        pipeline.execute()
+    return job_run_ids
+
+
+def schedule(expression, callable, *args, **kwargs):
+    """
+    run a function call on cron schedule `expression` (e.g. `*/5 * * * *`)
+
+    Times are in UTC. Schedules are run by the job queue's scheduler.
+
+    """
+    Cron(expression)
+
+    def insert_schedule(cur):
+        job_signature_id = find_job_signature(cur, callable, args, kwargs)
+        cur.cur.execute("""INSERT OR IGNORE INTO job_schedules
+                           (job_signature_id, minute, hour, day_of_month,
+                            month, day_of_week)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        [job_signature_id, *expression.split()])
+
+    tx.app.db_pool.write(insert_schedule)
 
 
 def get_job_signature(callable, *args, **kwargs):
@@ -1459,21 +2143,26 @@ def get_job_signature(callable, *args, **kwargs):
     return a job signature id creating a record if necessary
 
     """
+    return find_job_signature(tx.db, callable, args, kwargs)
+
+
+def find_job_signature(db, callable, args, kwargs):
+    """return the job signature id of a call using `db` or its cursor"""
     _module = callable.__module__
     _object = callable.__name__
     _args = json.dumps(args)
     _kwargs = json.dumps(kwargs)
     arghash = hashlib.sha256((_args + _kwargs).encode("utf-8")).hexdigest()
     try:
-        job_signature_id = tx.db.insert("job_signatures", module=_module,
-                                        object=_object, args=_args,
-                                        kwargs=_kwargs, arghash=arghash)
-    except tx.db.IntegrityError:
-        job_signature_id = tx.db.select("job_signatures", what="rowid, *",
-                                        where="""module = ? AND object = ? AND
-                                                 arghash = ?""",
-                                        vals=[_module, _object,
-                                              arghash])[0]["rowid"]
+        job_signature_id = db.insert("job_signatures", module=_module,
+                                     object=_object, args=_args,
+                                     kwargs=_kwargs, arghash=arghash)
+    except db.IntegrityError:
+        job_signature_id = db.select("job_signatures", what="rowid, *",
+                                     where="""module = ? AND object = ? AND
+                                              arghash = ?""",
+                                     vals=[_module, _object,
+                                           arghash])[0]["rowid"]
     return job_signature_id
 
 
@@ -0,0 +1,182 @@
+"""
+Static asset serving.
+
+Small hot assets are held in a bounded in-memory LRU while larger ones
+are streamed from disk via the server's `wsgi.file_wrapper` (sendfile
+under uWSGI). Every asset carries strong validators so that revisits
+are answered with `304 Not Modified`. Compressible assets are served
+from a precompressed `.gz` sibling when one is current, otherwise small
+ones are compressed once and cached.
+
+"""
+
+import collections
+import email.utils
+import mimetypes
+import pathlib
+import wsgiref.util
+
+from ..headers.request import AcceptEncoding
+from ..response import BadRequest, NotFound
+from .compression import is_compressible
+
+__all__ = ["AssetServer"]
+
+
+def get_etag(stat, encoding=None):
+    """return a strong entity tag for a file's `os.stat` result"""
+    suffix = f"-{encoding}" if encoding else ""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'
+
+
+def etag_matches(etag, if_none_match):
+    """return True if `etag` is listed in an `If-None-Match` header"""
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return etag in (candidate.strip().removeprefix("W/")
+                    for candidate in if_none_match.split(","))
+
+
+def not_modified_since(mtime, if_modified_since):
+    """return True if `mtime` is no later than `If-Modified-Since` header"""
+    try:
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since.timestamp()
+
+
+class AssetServer:
+
+    """
+    serve files found beneath any of the given `roots` (first match wins)
+
+    `cache_size` bounds the total bytes held in memory and assets larger
+    than `max_cached` bytes are always streamed in `chunk_size` pieces.
+    Pass a `compression.Compressor` as `compressor` to negotiate encodings.
+
+    """
+
+    def __init__(self, *roots, cache_size=2**23, max_cached=2**18,
+                 chunk_size=2**16, compressor=None):
+        self.roots = [pathlib.Path(root).resolve() for root in roots]
+        self.compressor = compressor
+        self.cache_size = cache_size
+        self.max_cached = max_cached
+        self.chunk_size = chunk_size
+        self.cache = collections.OrderedDict()
+        self.cached_bytes = 0
+
+    def find(self, asset_path):
+        """return the path and `os.stat` result of the named asset"""
+        if asset_path.startswith((".", "/")):
+            raise BadRequest("bad filename")
+        for root in self.roots:
+            path = (root / asset_path).resolve()
+            if root not in path.parents:
+                raise BadRequest("bad filename")
+            try:
+                stat = path.stat()
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if path.is_file():
+                return path, stat
+        raise NotFound("file not found")
+
+    def find_precompressed(self, path, stat):
+        """return the path and `os.stat` result of a current `.gz` sibling"""
+        sibling = path.with_name(path.name + ".gz")
+        try:
+            sibling_stat = sibling.stat()
+        except FileNotFoundError:
+            return None
+        if sibling_stat.st_mtime < stat.st_mtime:
+            return None
+        return sibling, sibling_stat
+
+    def read(self, path, stat, encoding=None):
+        """return the cached payload of small asset at `path`"""
+        key = (path, stat.st_mtime_ns, stat.st_size, encoding)
+        try:
+            payload = self.cache[key]
+        except KeyError:
+            with path.open("rb") as fp:
+                payload = fp.read()
+            if encoding:
+                payload = self.compressor.compress_bytes(payload, encoding)
+            self.cache[key] = payload
+            self.cached_bytes += len(payload)
+            while self.cached_bytes > self.cache_size:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+        else:
+            self.cache.move_to_end(key)
+        return payload
+
+    def __call__(self, environ, start_response, asset_path):
+        """the WSGI callable for the asset at `asset_path`"""
+        try:
+            path, stat = self.find(asset_path)
+        except (BadRequest, NotFound) as exc:
+            start_response(str(exc), [("Content-Type", "text/plain")])
+            return [exc.body.encode("utf-8")]
+        content_type = (mimetypes.guess_type(path.name)[0] or
+                        "application/octet-stream")
+        headers = []
+        encoding = None
+        if self.compressor and is_compressible(content_type):
+            headers.append(("Vary", "Accept-Encoding"))
+            accept_encoding = environ.get("HTTP_ACCEPT_ENCODING")
+            if accept_encoding:
+                accept_encoding = AcceptEncoding(accept_encoding)
+            encoding = self.compressor.negotiate(accept_encoding)
+        precompressed = None
+        if encoding == "gzip":
+            precompressed = self.find_precompressed(path, stat)
+        if precompressed:
+            path, stat = precompressed
+        elif not (encoding and self.compressor.threshold <= stat.st_size <=
+                  self.max_cached):
+            encoding = None
+        etag = get_etag(stat, encoding)
+        headers += [("ETag", etag),
+                    ("Last-Modified",
+                     email.utils.formatdate(stat.st_mtime, usegmt=True))]
+
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        if_modified_since = environ.get("HTTP_IF_MODIFIED_SINCE")
+        if if_none_match is not None:
+            unchanged = etag_matches(etag, if_none_match)
+        elif if_modified_since is not None:
+            unchanged = not_modified_since(stat.st_mtime,
+                                           if_modified_since)
+        else:
+            unchanged = False
+        if unchanged:
+            start_response("304 Not Modified", headers)
+            return []
+
+        if precompressed:
+            payload = None
+            headers.append(("Content-Encoding", "gzip"))
+            size = stat.st_size
+        elif encoding:
+            payload = self.read(path, stat, encoding)
+            headers.append(("Content-Encoding", encoding))
+            size = len(payload)
+        else:
+            payload = None
+            size = stat.st_size
+        headers += [("Content-Type", content_type),
+                    ("Content-Length", str(size))]
+        start_response("200 OK", headers)
+        if environ.get("REQUEST_METHOD") == "HEAD":
+            return []
+        if payload is None and stat.st_size <= self.max_cached:
+            payload = self.read(path, stat)
+        if payload is not None:
+            return [payload]
+        file_wrapper = environ.get("wsgi.file_wrapper",
+                                   wsgiref.util.FileWrapper)
+        return file_wrapper(path.open("rb"), self.chunk_size)
@@ -0,0 +1,76 @@
+"""
+Negotiated response compression.
+
+"""
+
+import zlib
+
+__all__ = ["Compressor", "is_compressible"]
+
+_wbits = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+_compressible_types = {"application/javascript", "application/json",
+                       "application/xml", "application/xhtml+xml",
+                       "application/rss+xml", "application/atom+xml",
+                       "image/svg+xml"}
+
+
+def is_compressible(content_type):
+    """return True if media of `content_type` benefits from compression"""
+    content_type = str(content_type).partition(";")[0].strip().lower()
+    return (content_type.startswith("text/") or
+            content_type in _compressible_types or
+            content_type.endswith(("+json", "+xml")))
+
+
+class Compressor:
+
+    """
+    compress response bodies using an encoding negotiated from the request
+
+    Bodies of known length smaller than `threshold` bytes are left as is.
+
+    """
+
+    encodings = ("gzip", "deflate")
+
+    def __init__(self, threshold=1024, level=6):
+        self.threshold = threshold
+        self.level = level
+
+    def negotiate(self, accept_encoding):
+        """
+        return the best supported encoding for an `Accept-Encoding` header
+
+            >>> from web.headers.request import AcceptEncoding
+            >>> Compressor().negotiate(AcceptEncoding("deflate, gzip;q=.5"))
+            'deflate'
+
+        """
+        if accept_encoding is None:
+            return None
+        refused = {acceptable.value for acceptable
+                   in accept_encoding.acceptables if acceptable.quality <= 0}
+        for acceptable in accept_encoding.acceptables:
+            if acceptable.quality <= 0:
+                break
+            if acceptable.value in self.encodings:
+                return acceptable.value
+            elif acceptable.value == "*":
+                for encoding in self.encodings:
+                    if encoding not in refused:
+                        return encoding
+        return None
+
+    def compress(self, chunks, encoding):
+        """yield `chunks` of bytes compressed using `encoding`"""
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED,
+                                      _wbits[encoding])
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    def compress_bytes(self, payload, encoding):
+        """return `payload` compressed using `encoding`"""
+        return b"".join(self.compress([payload], encoding))
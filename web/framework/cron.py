@@ -0,0 +1,119 @@
+"""
+Cron expressions.
+
+Five fields -- minute, hour, day of month, month and day of week -- each
+of `*`, a value, a range `a-b` or a comma separated list of these with an
+optional `/step`. Months and days of the week may be given by name. As in
+cron a day matches when either day field does if both are restricted (a
+field starting with `*`, such as `*/2`, is unrestricted). Ranges don't
+wrap around but `sun` ends a range of days as 7, as in `fri-sun`.
+
+"""
+
+import datetime
+
+__all__ = ["Cron"]
+
+month_names = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug",
+               "sep", "oct", "nov", "dec"]
+day_names = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+horizon = 5  # years searched ahead before a schedule is deemed impossible
+
+
+def parse_field(field, low, high, names=()):
+    """
+    return the set of values in `field`
+
+        >>> sorted(parse_field("1-10/3,20", 0, 59))
+        [1, 4, 7, 10, 20]
+
+    A name given more than once in `names` takes its later value when it
+    would otherwise end a range before its start.
+
+    """
+    def value(token):
+        if token in names:
+            return names.index(token) + low
+        return int(token)
+
+    values = set()
+    for part in field.lower().split(","):
+        part, slash, step = part.partition("/")
+        step = int(step) if slash else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            first, last = part.split("-", 1)
+            start, end = value(first), value(last)
+            if end < start and last in names:
+                end = len(names) - 1 - names[::-1].index(last) + low
+            if end < start:
+                raise ValueError(f"cron range `{part}` runs backwards; "
+                                 "ranges don't wrap around")
+        else:
+            start = value(part)
+            end = high if slash else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"invalid cron field `{field}`")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+
+    """
+    a cron schedule
+
+        >>> cron = Cron("30 9 * * mon-fri")
+        >>> cron.next_fire(datetime.datetime(2024, 6, 7, 9, 30))  # a friday
+        datetime.datetime(2024, 6, 10, 9, 30)
+
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression `{expression}` must have "
+                             "five fields")
+        minute, hour, day_of_month, month, day_of_week = fields
+        self.expression = expression
+        self.minutes = sorted(parse_field(minute, 0, 59))
+        self.hours = parse_field(hour, 0, 23)
+        self.days_of_month = parse_field(day_of_month, 1, 31)
+        self.months = parse_field(month, 1, 12, month_names)
+        self.days_of_week = {day % 7 for day in
+                             parse_field(day_of_week, 0, 7,
+                                         day_names + ["sun"])}
+        self.any_day_of_month = day_of_month.startswith("*")
+        self.any_day_of_week = day_of_week.startswith("*")
+
+    def __repr__(self):
+        return f"Cron({self.expression!r})"
+
+    def matches_day(self, date):
+        day_of_month = date.day in self.days_of_month
+        day_of_week = date.isoweekday() % 7 in self.days_of_week
+        if self.any_day_of_month or self.any_day_of_week:
+            return day_of_month and day_of_week
+        return day_of_month or day_of_week
+
+    def next_fire(self, after):
+        """return the first time strictly after `after` or None if never"""
+        moment = (after.replace(second=0, microsecond=0) +
+                  datetime.timedelta(minutes=1))
+        last_year = moment.year + horizon
+        while moment.year <= last_year:
+            if moment.month not in self.months:
+                moment = moment.replace(day=1, hour=0, minute=0)
+                moment = (moment + datetime.timedelta(days=32)).replace(day=1)
+                continue
+            if not self.matches_day(moment):
+                moment = moment.replace(hour=0, minute=0)
+                moment += datetime.timedelta(days=1)
+                continue
+            if moment.hour in self.hours:
+                for minute in self.minutes:
+                    if minute >= moment.minute:
+                        return moment.replace(minute=minute)
+            moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+        return None
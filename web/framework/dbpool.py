@@ -0,0 +1,185 @@
+"""
+Pooled database handles.
+
+Each process keeps one pool per application database. Its shared handle
+serves ordinary single-statement work (SQLite calls never yield to other
+greenlets mid-statement) while greenlets that hold a transaction open
+across a yield check out a handle of their own. Handles live as long as
+the process so SQLite's per-connection statement cache stays warm.
+
+Connections use write-ahead logging so that readers never block the
+writer, and a busy timeout so that writers in other processes wait for
+the lock rather than fail.
+
+Writes handed to `Pool.write` are serialized through a single writer
+greenlet which commits whatever has queued up in one transaction.
+
+"""
+
+import contextlib
+import os
+import traceback
+
+import gevent
+import gevent.event
+import gevent.queue
+import sql
+
+__all__ = ["Pool", "configure"]
+
+synchronous_levels = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def configure(db, busy_timeout=5000, synchronous="NORMAL"):
+    """
+    switch `db` to write-ahead logging and set its locking behaviour
+
+    `NORMAL` synchronization is durable across application crashes and
+    only risks the last transactions upon power loss when in WAL mode.
+
+    """
+    if synchronous.upper() not in synchronous_levels:
+        raise ValueError(f"synchronous must be one of {synchronous_levels}")
+    db.conn.execute("PRAGMA journal_mode = WAL")
+    db.conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout)}")
+    db.conn.execute(f"PRAGMA synchronous = {synchronous.upper()}")
+    return db
+
+
+class Pool:
+
+    """
+    a shared handle and up to `size` checkout handles on database `path`
+
+    """
+
+    def __init__(self, path, size=4, busy_timeout=5000, synchronous="NORMAL",
+                 batch_size=256):
+        self.path = path
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self.batch_size = batch_size
+        self.pid = os.getpid()
+        self.shared = self._connect()
+        self.idle = gevent.queue.LifoQueue()
+        self.created = 0
+        self.bound = {}
+        self.writes = gevent.queue.Queue()
+        self.writer = None
+
+    def __repr__(self):
+        return (f"<dbpool: {self.path} ({self.in_use} in use, "
+                f"{self.pending_writes} pending writes)>")
+
+    def _connect(self):
+        return configure(sql.db(self.path), self.busy_timeout,
+                         self.synchronous)
+
+    @property
+    def in_use(self):
+        return len(self.bound)
+
+    @property
+    def pending_writes(self):
+        return self.writes.qsize()
+
+    @property
+    def db(self):
+        """the handle checked out by the current greenlet or the shared one"""
+        return self.bound.get(gevent.getcurrent(), self.shared)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        check a handle out to the current greenlet for a `with` block
+
+        Waits for a handle to be returned when all `size` are in use.
+        Nested checkouts by the same greenlet reuse its handle.
+
+        """
+        current = gevent.getcurrent()
+        if current in self.bound:
+            yield self.bound[current]
+            return
+        handle = self._acquire()
+        self.bound[current] = handle
+        try:
+            yield handle
+        finally:
+            del self.bound[current]
+            self._release(handle)
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except gevent.queue.Empty:
+            pass
+        if self.created < self.size:
+            self.created += 1
+            try:
+                return self._connect()
+            except Exception:
+                self.created -= 1
+                raise
+        return self.idle.get()
+
+    def _release(self, handle):
+        if handle.conn.in_transaction:
+            handle.conn.rollback()
+        self.idle.put(handle)
+
+    def write(self, operation, wait=True):
+        """
+        run `operation(cursor)` in the writer's next transaction
+
+        Operations queued together are committed together. Returns the
+        operation's result, or raises its exception, unless `wait` is
+        false. Should a batch fail its operations are retried one by one
+        so they must only touch the database and must not yield.
+
+        """
+        result = gevent.event.AsyncResult() if wait else None
+        self.writes.put((operation, result))
+        if self.writer is None or self.writer.dead:
+            self.writer = gevent.spawn(self._write)
+        if wait:
+            return result.get()
+
+    def flush(self):
+        """wait until every queued write has been committed"""
+        if self.writer is not None:
+            self.write(lambda cur: None)
+
+    def _write(self):
+        while True:
+            batch = [self.writes.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except gevent.queue.Empty:
+                    break
+            try:
+                with self.shared.transaction as cur:
+                    values = [operation(cur) for operation, _ in batch]
+            except Exception:
+                for operation, result in batch:
+                    self._write_one(operation, result)
+            else:
+                for (_, result), value in zip(batch, values):
+                    if result is not None:
+                        result.set(value)
+
+    def _write_one(self, operation, result):
+        try:
+            with self.shared.transaction as cur:
+                value = operation(cur)
+        except Exception as err:
+            if result is None:
+                traceback.print_exc()
+            else:
+                result.set_exception(err)
+        else:
+            if result is not None:
+                result.set(value)
+
@@ -0,0 +1,201 @@
+"""
+Form data and a streaming `multipart/form-data` parser.
+
+Uploaded files are written to `tempfile.SpooledTemporaryFile`s as they
+are read so that large parts roll over to disk instead of being held in
+memory.
+
+"""
+
+import email.message
+import tempfile
+import urllib.parse
+
+__all__ = ["Field", "FormData", "parse_urlencoded", "parse_multipart",
+           "read_chunks", "BodyTooLarge", "MalformedBody"]
+
+
+class BodyTooLarge(Exception):
+
+    """the request body exceeds the configured limit"""
+
+
+class MalformedBody(Exception):
+
+    """the request body could not be parsed"""
+
+
+class Field:
+
+    """
+    a form field; uploads keep their content in a file at `file`
+
+    """
+
+    def __init__(self, name, value=None, filename=None, content_type=None,
+                 file=None):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.file = file
+        self._value = value
+
+    @property
+    def value(self):
+        if self._value is None and self.file is not None:
+            self.file.seek(0)
+            return self.file.read()
+        return self._value
+
+    def __repr__(self):
+        if self.filename:
+            return f"Field({self.name!r}, filename={self.filename!r})"
+        return f"Field({self.name!r}, {self._value!r})"
+
+
+class FormData:
+
+    """
+    an ordered multi-mapping of field names to `Field`s
+
+        >>> data = parse_urlencoded("a=1&a=2&b=")
+        >>> data.getfirst("a"), data.getlist("a"), data.getfirst("b")
+        ('1', ['1', '2'], '')
+
+    """
+
+    def __init__(self):
+        self._fields = {}
+
+    def add(self, field):
+        self._fields.setdefault(field.name, []).append(field)
+
+    def keys(self):
+        return self._fields.keys()
+
+    def getfirst(self, name, default=None):
+        try:
+            return self._fields[name][0].value
+        except KeyError:
+            return default
+
+    def getlist(self, name):
+        return [field.value for field in self._fields.get(name, [])]
+
+    def __getitem__(self, name):
+        fields = self._fields[name]
+        if len(fields) == 1:
+            return fields[0]
+        return fields
+
+    def __contains__(self, name):
+        return name in self._fields
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return f"FormData({list(self._fields.values())!r})"
+
+
+def read_chunks(stream, length=None, limit=None, chunk_size=2**16):
+    """
+    yield chunks from `stream` up to `length` bytes, enforcing `limit`
+
+    """
+    if length is not None and limit is not None and length > limit:
+        raise BodyTooLarge(f"{length} bytes exceeds limit of {limit}")
+    remaining = length
+    received = 0
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size,
+                                                         remaining)
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        received += len(chunk)
+        if limit is not None and received > limit:
+            raise BodyTooLarge(f"body exceeds limit of {limit} bytes")
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def parse_urlencoded(query, form=None):
+    """return a `FormData` of the fields in urlencoded `query`"""
+    if form is None:
+        form = FormData()
+    for name, value in urllib.parse.parse_qsl(query, keep_blank_values=True):
+        form.add(Field(name, value))
+    return form
+
+
+def _parse_part_headers(raw_headers):
+    message = email.message.Message()
+    for line in raw_headers.decode("utf-8", "replace").split("\r\n"):
+        name, _, value = line.partition(":")
+        if name.strip():
+            message[name.strip()] = value.strip()
+    name = message.get_param("name", header="content-disposition")
+    filename = message.get_filename()
+    return name, filename, message.get_content_type()
+
+
+def parse_multipart(chunks, boundary, form=None, spool_size=2**20,
+                    max_header_size=2**14):
+    """
+    return a `FormData` parsed from an iterable of multipart body `chunks`
+
+    File parts are spooled to disk beyond `spool_size` bytes.
+
+    """
+    if form is None:
+        form = FormData()
+    delimiter = b"--" + boundary.encode("latin-1")
+    separator = b"\r\n" + delimiter
+    chunks = iter(chunks)
+    buffer = b""
+
+    def fill():
+        nonlocal buffer
+        try:
+            buffer += next(chunks)
+        except StopIteration:
+            raise MalformedBody("unexpected end of multipart body")
+
+    while delimiter not in buffer:  # skip the preamble
+        buffer = buffer[-len(delimiter):]
+        fill()
+    buffer = buffer[buffer.index(delimiter) + len(delimiter):]
+    while True:
+        while len(buffer) < 2:
+            fill()
+        if buffer.startswith(b"--"):
+            return form
+        while b"\r\n\r\n" not in buffer:
+            if len(buffer) > max_header_size:
+                raise MalformedBody("multipart headers too large")
+            fill()
+        raw_headers, _, buffer = buffer.partition(b"\r\n\r\n")
+        name, filename, content_type = _parse_part_headers(raw_headers[2:])
+        if filename is None:
+            pieces = []
+            write = pieces.append
+        else:
+            sink = tempfile.SpooledTemporaryFile(max_size=spool_size)
+            write = sink.write
+        keep = len(separator) - 1
+        while separator not in buffer:
+            if len(buffer) > keep:
+                write(buffer[:-keep])
+                buffer = buffer[-keep:]
+            fill()
+        data, _, buffer = buffer.partition(separator)
+        write(data)
+        if filename is None:
+            value = b"".join(pieces).decode("utf-8", "replace")
+            form.add(Field(name, value, content_type=content_type))
+        else:
+            sink.seek(0)
+            form.add(Field(name, filename=filename, content_type=content_type,
+                           file=sink))
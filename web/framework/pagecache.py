@@ -0,0 +1,186 @@
+"""
+Full-page response cache.
+
+Renderings are stored per host and path and told apart by a variant
+field made of the query string, the media type negotiated by
+`best_match`, the negotiated content coding and an optional session
+segment. Purging a path drops all of its variants at once.
+
+A bounded in-process LRU fronts a store shared between processes (the
+app's redis). Local copies are kept for at most `local_ttl` seconds so
+that purges made elsewhere (e.g. by a job worker) take effect promptly.
+
+"""
+
+import base64
+import collections
+import json
+import time
+
+__all__ = ["Page", "LocalBackend", "KVBackend", "PageCache"]
+
+Page = collections.namedtuple("Page", "status headers body expires")
+
+
+def encode(value):
+    """
+    return a page (or a list of variants) as JSON
+
+        >>> page = Page("200 OK", [("Vary", "Accept")], b"hi", 1)
+        >>> decode(encode(page)) == page
+        True
+
+    """
+    if isinstance(value, Page):
+        body = base64.b64encode(value.body).decode("ascii")
+        return json.dumps({"page": [value.status, value.headers, body,
+                                    value.expires]})
+    return json.dumps({"value": value})
+
+
+def decode(payload):
+    """return the page (or list of variants) encoded in `payload`"""
+    value = json.loads(payload)
+    if "page" not in value:
+        return value["value"]
+    status, headers, body, expires = value["page"]
+    return Page(status, [tuple(header) for header in headers],
+                base64.b64decode(body), expires)
+
+
+class LocalBackend:
+
+    """
+    an in-process LRU of pages bounded to `max_bytes` of body
+
+        >>> backend = LocalBackend(max_bytes=10)
+        >>> backend.set("x/a", "", Page("200 OK", [], b"12345678", 0), 60)
+        >>> backend.set("x/b", "", Page("200 OK", [], b"12345678", 0), 60)
+        >>> backend.get("x/a", ""), backend.get("x/b", "").body
+        (None, b'12345678')
+
+    """
+
+    def __init__(self, max_bytes=2**25, local_ttl=None):
+        self.max_bytes = max_bytes
+        self.local_ttl = local_ttl
+        self.entries = collections.OrderedDict()
+        self.fields = collections.defaultdict(set)
+        self.size = 0
+
+    def get(self, resource, field):
+        key = resource, field
+        try:
+            expires, value = self.entries[key]
+        except KeyError:
+            return None
+        if expires < time.time():
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, resource, field, value, ttl):
+        key = resource, field
+        if key in self.entries:
+            self._drop(key)
+        if self.local_ttl is not None:
+            ttl = min(ttl, self.local_ttl)
+        self.entries[key] = time.time() + ttl, value
+        self.fields[resource].add(field)
+        self.size += self._sizeof(value)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+
+    def purge(self, resource):
+        for field in list(self.fields.get(resource, ())):
+            self._drop((resource, field))
+
+    def _drop(self, key):
+        _, value = self.entries.pop(key)
+        self.size -= self._sizeof(value)
+        resource, field = key
+        self.fields[resource].discard(field)
+        if not self.fields[resource]:
+            del self.fields[resource]
+
+    @staticmethod
+    def _sizeof(value):
+        return len(value.body) if isinstance(value, Page) else 0
+
+
+class KVBackend:
+
+    """
+    pages shared between processes in one redis hash per host and path
+
+    `redis` is a redis client (e.g. the `db` of the app's `kv`). Values
+    are stored as JSON so that nothing read back from redis is executed.
+
+    """
+
+    def __init__(self, redis, prefix="web:pages:"):
+        self.redis = redis
+        self.prefix = prefix
+
+    def get(self, resource, field):
+        payload = self.redis.hget(self.prefix + resource, field)
+        if payload is None:
+            return None
+        value = decode(payload)
+        if isinstance(value, Page) and value.expires < time.time():
+            return None
+        return value
+
+    def set(self, resource, field, value, ttl):
+        key = self.prefix + resource
+        pipeline = self.redis.pipeline()
+        pipeline.hset(key, field, encode(value))
+        pipeline.expire(key, int(ttl) + 1)
+        pipeline.execute()
+
+    def purge(self, resource):
+        self.redis.delete(self.prefix + resource)
+
+
+class PageCache:
+
+    """
+    look pages up in each of `backends` in turn, filling the faster ones
+
+    """
+
+    def __init__(self, *backends):
+        self.backends = backends
+
+    @staticmethod
+    def get_resource(host, path):
+        return f"{host}/{path.strip('/')}"
+
+    @staticmethod
+    def get_field(query="", variant="", encoding="", segment=""):
+        return "|".join((query, variant or "", encoding or "", segment or ""))
+
+    def get(self, resource, field):
+        for index, backend in enumerate(self.backends):
+            value = backend.get(resource, field)
+            if value is not None:
+                if isinstance(value, Page):
+                    ttl = value.expires - time.time()
+                else:
+                    ttl = 60
+                for faster in self.backends[:index]:
+                    faster.set(resource, field, value, ttl)
+                return value
+        return None
+
+    def set(self, resource, field, value, ttl):
+        for backend in self.backends:
+            backend.set(resource, field, value, ttl)
+
+    def purge(self, host, *paths):
+        """drop every cached variant of each of `paths` on `host`"""
+        for path in paths:
+            resource = self.get_resource(host, path)
+            for backend in self.backends:
+                backend.purge(resource)
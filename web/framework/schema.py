@@ -0,0 +1,104 @@
+"""
+Database schemas.
+
+Tables and indexes are declared up front and applied to a database when
+a process first opens it or an application first registers them. Applied
+definitions are recorded in the database's `web_schema` table so that DDL
+is only issued when a definition is new or has changed; columns added to
+an existing table's definition are migrated in with `ALTER TABLE`.
+
+"""
+
+import hashlib
+import json
+import re
+
+__all__ = ["Schema", "schema", "migrate"]
+
+_applied = set()
+_constraint_re = re.compile(r"^(UNIQUE|PRIMARY|CHECK|FOREIGN|CONSTRAINT)\b",
+                            re.IGNORECASE)
+
+
+class Schema:
+
+    """
+    tables (name to column definitions) and indexes (name to `table (cols)`)
+
+    """
+
+    def __init__(self, tables=None, indexes=None):
+        self.tables = dict(tables or {})
+        self.indexes = dict(indexes or {})
+        self.digest = hashlib.sha256(json.dumps([self.tables, self.indexes],
+                                                sort_keys=True)
+                                     .encode("utf-8")).hexdigest()
+
+    def __repr__(self):
+        return f"Schema({list(self.tables)}, {list(self.indexes)})"
+
+
+def schema(indexes=None, **tables):
+    """
+    decorate a wrapper hook with the tables and indexes it relies upon
+
+    The schema is applied when the hook is registered with an application
+    rather than upon each request.
+
+    """
+    def decorate(hook):
+        hook.schema = Schema(tables, indexes)
+        return hook
+    return decorate
+
+
+def get_columns(definition):
+    """
+    return the column definitions of a table definition keyed by name
+
+        >>> list(get_columns("a TEXT, b INTEGER DEFAULT(1), UNIQUE(a, b)"))
+        ['a', 'b']
+
+    """
+    columns = {}
+    depth = 0
+    part = ""
+    for character in definition + ",":
+        if character == "," and depth == 0:
+            part = " ".join(part.split())
+            if part and not _constraint_re.match(part):
+                columns[part.split()[0]] = part
+            part = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(character, 0)
+        part += character
+    return columns
+
+
+def migrate(db, schema):
+    """apply `schema` to `db` unless it already has been"""
+    key = getattr(db, "path", id(db)), schema.digest
+    if key in _applied:
+        return
+    db.define(web_schema="""name TEXT PRIMARY KEY, definition TEXT""")
+    recorded = {row["name"]: row["definition"]
+                for row in db.select("web_schema")}
+    for table, definition in schema.tables.items():
+        name = f"table:{table}"
+        if recorded.get(name) == definition:
+            continue
+        db.define(**{table: definition})
+        existing = {row[1] for row in
+                    db.conn.execute(f"PRAGMA table_info({table})")}
+        for column, column_definition in get_columns(definition).items():
+            if column not in existing:
+                db.conn.execute(f"ALTER TABLE {table} "
+                                f"ADD COLUMN {column_definition}")
+        db.replace("web_schema", name=name, definition=definition)
+    for index, definition in schema.indexes.items():
+        name = f"index:{index}"
+        if recorded.get(name) == definition:
+            continue
+        db.conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {definition}")
+        db.replace("web_schema", name=name, definition=definition)
+    _applied.add(key)
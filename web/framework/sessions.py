@@ -0,0 +1,277 @@
+"""
+Session storage.
+
+Stores are handed sessions already encoded (by their `encode`) so that
+the hooks may compare a session's encoding after a request with its
+encoding when it was resumed and never write back the unchanged
+sessions of plain page views.
+
+"""
+
+import atexit
+import collections
+import json
+import time
+import traceback
+
+import gevent
+
+__all__ = ["DatabaseSessionStore", "KVSessionStore"]
+
+
+class DatabaseSessionStore:
+
+    """
+    sessions kept in the `sessions` table of an application's database
+
+    `get_db` returns the current process's handle on the database. It is
+    called upon each use so that forked workers never share a connection
+    inherited from their parent.
+
+    The table (and the index on `timestamp` used by the sweeper) is
+    declared in the framework's `session_schema`. Up to `cache_size`
+    recently seen sessions are held in-process along with when they were
+    last written. Once another connection has written to the database (as
+    reported by SQLite's `data_version`) each cached session is read
+    again, on its own, the next time it is loaded. Unchanged sessions
+    have their timestamp refreshed at most every `touch_interval` seconds
+    so that the sweeper only expires idle sessions.
+
+    With `write_behind` writes are queued and flushed in one transaction
+    every `flush_interval` seconds. Queued writes are invisible to other
+    processes until flushed so only use it when one process serves the
+    database.
+
+    """
+
+    def __init__(self, get_db, encode=json.dumps, cache_size=4096,
+                 touch_interval=3600, write_behind=False, flush_interval=1):
+        self.get_db = get_db
+        self.encode = encode
+        self.cache_size = cache_size
+        self.touch_interval = touch_interval
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.cache = collections.OrderedDict()
+        self.generation = 0
+        self.pending = {}
+        self.touches = set()
+        self.workers = []
+        self.data_version = self._get_data_version()
+
+    @property
+    def db(self):
+        return self.get_db()
+
+    def _execute(self, statement):
+        return self.db.conn.execute(statement)
+
+    def _get_data_version(self):
+        return self._execute("PRAGMA data_version").fetchone()[0]
+
+    def _check_cache(self):
+        data_version = self._get_data_version()
+        if data_version != self.data_version:
+            self.generation += 1
+            self.data_version = data_version
+
+    def _remember(self, identifier, payload, touched):
+        self.cache[identifier] = payload, touched, self.generation
+        self.cache.move_to_end(identifier)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _read(self, identifier):
+        rows = self.db.select("sessions",
+                              what="data, CAST(strftime('%s', timestamp) "
+                                   "AS INTEGER) AS touched",
+                              where="identifier = ?", vals=[identifier])
+        if not rows:
+            self.cache.pop(identifier, None)
+            return None
+        payload = rows[0]["data"]
+        self._remember(identifier, payload, rows[0]["touched"] or 0)
+        return payload
+
+    def load(self, identifier):
+        """return the data of session `identifier` or None if it is unknown"""
+        if identifier in self.pending:
+            payload = self.pending[identifier]
+        else:
+            self._check_cache()
+            try:
+                payload, _, generation = self.cache[identifier]
+            except KeyError:
+                generation = None
+            if generation == self.generation:
+                self.cache.move_to_end(identifier)
+            else:
+                payload = self._read(identifier)
+        if payload is None:
+            return None
+        try:
+            return json.loads(payload)
+        except json.decoder.JSONDecodeError:
+            return None
+
+    def save(self, identifier, payload):
+        """store the encoded session `payload` under `identifier`"""
+        self._remember(identifier, payload, time.time())
+        if self.write_behind:
+            self.pending[identifier] = payload
+            self.touches.discard(identifier)
+        else:
+            self.db.replace("sessions", identifier=identifier, data=payload)
+
+    def touch(self, identifier):
+        """refresh the timestamp of an unchanged session when it is due"""
+        try:
+            payload, touched, _ = self.cache[identifier]
+        except KeyError:
+            return
+        now = time.time()
+        if now - touched < self.touch_interval:
+            return
+        self._remember(identifier, payload, now)
+        if self.write_behind:
+            if identifier not in self.pending:
+                self.touches.add(identifier)
+        else:
+            self.db.update("sessions", what="timestamp = CURRENT_TIMESTAMP",
+                           where="identifier = ?", vals=[identifier])
+
+    def delete(self, identifier):
+        """forget session `identifier`"""
+        self.cache.pop(identifier, None)
+        self.touches.discard(identifier)
+        if self.write_behind:
+            self.pending[identifier] = None
+        else:
+            self.db.delete("sessions", where="identifier = ?",
+                           vals=[identifier])
+
+    def flush(self):
+        """write queued changes in a single transaction"""
+        pending, self.pending = self.pending, {}
+        touches, self.touches = self.touches, set()
+        if not (pending or touches):
+            return
+        with self.db.transaction as cur:
+            for identifier, payload in pending.items():
+                if payload is None:
+                    cur.delete("sessions", where="identifier = ?",
+                               vals=[identifier])
+                else:
+                    cur.replace("sessions", identifier=identifier,
+                                data=payload)
+            for identifier in touches:
+                cur.update("sessions", what="timestamp = CURRENT_TIMESTAMP",
+                           where="identifier = ?", vals=[identifier])
+
+    def sweep(self, timeout):
+        """delete sessions idle for longer than `timeout` seconds"""
+        self.flush()
+        self.db.delete("sessions", where="timestamp < DATETIME('now', ?)",
+                       vals=[f"-{int(timeout)} seconds"])
+        self.cache.clear()
+
+    def start(self, timeout, sweep_interval=3600):
+        """start the background sweeper (and flusher) once per process"""
+        if self.workers:
+            return
+
+        def run(interval, handler, *args):
+            while True:
+                gevent.sleep(interval)
+                try:
+                    handler(*args)
+                except Exception:
+                    traceback.print_exc()
+
+        self.workers.append(gevent.spawn(run, sweep_interval, self.sweep,
+                                         timeout))
+        if self.write_behind:
+            self.workers.append(gevent.spawn(run, self.flush_interval,
+                                             self.flush))
+            atexit.register(self.flush)
+
+
+class KVSessionStore:
+
+    """
+    sessions kept in a kv store shared by every node serving an app
+
+    `redis` is a redis client (e.g. the `db` of the app's `kv`). Loading a
+    session costs a single pipelined round trip that also slides its
+    expiry and saving one costs a single `SET`. Loaded sessions are cached
+    locally for `local_ttl` seconds, during which other nodes' changes
+    may go unseen.
+
+    """
+
+    def __init__(self, redis, encode=json.dumps, prefix="web:sessions:",
+                 timeout=86400, local_ttl=1, cache_size=4096,
+                 touch_interval=60):
+        self.redis = redis
+        self.encode = encode
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local_ttl = local_ttl
+        self.cache_size = cache_size
+        self.touch_interval = touch_interval
+        self.cache = collections.OrderedDict()
+
+    def _key(self, identifier):
+        return f"{self.prefix}{identifier}:data"
+
+    def _remember(self, identifier, payload, touched):
+        self.cache[identifier] = payload, time.time(), touched
+        self.cache.move_to_end(identifier)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def load(self, identifier):
+        """return the data of session `identifier` or None if it is unknown"""
+        try:
+            payload, fetched, _ = self.cache[identifier]
+        except KeyError:
+            fetched = 0
+        if time.time() - fetched > self.local_ttl:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.get(self._key(identifier))
+            pipeline.expire(self._key(identifier), self.timeout)
+            payload, _ = pipeline.execute()
+            if payload is None:
+                self.cache.pop(identifier, None)
+                return None
+            self._remember(identifier, payload, time.time())
+        try:
+            return json.loads(payload)
+        except json.decoder.JSONDecodeError:
+            return None
+
+    def save(self, identifier, payload):
+        """store the encoded session `payload` under `identifier`"""
+        self.redis.set(self._key(identifier), payload, ex=self.timeout)
+        self._remember(identifier, payload, time.time())
+
+    def touch(self, identifier):
+        """slide the expiry of a session read from the local cache"""
+        try:
+            payload, fetched, touched = self.cache[identifier]
+        except KeyError:
+            return
+        now = time.time()
+        if now - touched < self.touch_interval:
+            return
+        self.cache[identifier] = payload, fetched, now
+        self.redis.expire(self._key(identifier), self.timeout)
+
+    def delete(self, identifier):
+        """forget session `identifier`"""
+        self.cache.pop(identifier, None)
+        self.redis.delete(self._key(identifier))
+
+    def start(self, timeout):
+        """adopt the application's session `timeout`; expiry is server-side"""
+        self.timeout = timeout
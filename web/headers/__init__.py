@@ -11,16 +11,28 @@ from . import response
 __all__ = ["get_header", "Headers"]
 
 
+_header_types = {name.lower(): getattr(module, name)
+                 for module in (response, request, general, entity)
+                 for name in module.__all__}
+
+
+def _normalize(header):
+    return header.lower().replace("_", "").replace("-", "")
+
+
 def get_header(header, value=None):
     """
+    return `value` wrapped in the class registered for `header` if any
+
+        >>> type(get_header("Accept-Encoding", "gzip")).__name__
+        'AcceptEncoding'
 
     """
-    header = header.lower().replace("_", "").replace("-", "")
-    for header_type in (entity, general, request, response):
-        for search_name in header_type.__all__:
-            if search_name.lower() == header:
-                return getattr(header_type, search_name)(value)
-    return value
+    try:
+        header_type = _header_types[_normalize(header)]
+    except KeyError:
+        return value
+    return header_type(value)
 
 
 def _title_case(header):
@@ -40,46 +40,64 @@ class Entity(Header):
 
     """"""
 
+    __slots__ = ()
+
 
 class Allow(Entity):
 
     """"""
 
+    __slots__ = ()
+
 
 class ContentEncoding(Entity):
 
     """"""
 
+    __slots__ = ()
+
 
 class ContentLanguage(Entity):
 
     """"""
 
+    __slots__ = ()
+
 
 class ContentLength(Entity):
 
     """"""
 
+    __slots__ = ()
+
 
 class ContentLocation(Entity):
 
     """"""
 
+    __slots__ = ()
+
 
 class ContentMD5(Entity):
 
     """"""
 
+    __slots__ = ()
+
 
 class ContentRange(Entity):
 
     """"""
 
+    __slots__ = ()
+
 
 class ContentType(Entity):
 
     """"""
 
+    __slots__ = ()
+
     @property
     def content_type(self):
         _content_type = str(self).partition(";")[0]
@@ -97,6 +115,8 @@ class Expires(Entity):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, when):
         # FIXME either seconds a la TTL or datetime according to W3C
         now = datetime.datetime.utcnow()
@@ -117,5 +137,7 @@ class LastModified(Entity):
 
     """"""
 
+    __slots__ = ()
+
     # def __init__(self, when):
     #     self.header = util.format_datetime(when)
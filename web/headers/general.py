@@ -12,47 +12,67 @@ class General(util.Header):
 
     """"""
 
+    __slots__ = ()
+
 
 class CacheControl(General):
 
     """"""
 
+    __slots__ = ()
+
 
 class Connection(General):
 
     """"""
 
+    __slots__ = ()
+
 
 class Date(General):
 
     """"""
 
+    __slots__ = ()
+
 
 class Pragma(General):
 
     """"""
 
+    __slots__ = ()
+
 
 class Trailer(General):
 
     """"""
 
+    __slots__ = ()
+
 
 class TransferEncoding(General):
 
     """"""
 
+    __slots__ = ()
+
 
 class Upgrade(General):
 
     """"""
 
+    __slots__ = ()
+
 
 class Via(General):
 
     """"""
 
+    __slots__ = ()
+
 
 class Warning(General):
 
     """"""
+
+    __slots__ = ()
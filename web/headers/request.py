@@ -23,11 +23,15 @@ class Request(util.Header):
 
     """"""
 
+    __slots__ = ()
+
 
 class _Accept(Request):
 
     """"""
 
+    __slots__ = ("acceptables",)
+
     def parse(self):
         acceptables = []
         noq = 1
@@ -78,6 +82,8 @@ class Accept(_Accept):
 
     """
 
+    __slots__ = ()
+
     def best_match(self, supported):
         return mimeparse.best_match(supported, self.header)
 
@@ -104,6 +110,8 @@ class AcceptCharset(_Accept):
 
     """
 
+    __slots__ = ()
+
     class Charset(_Accept._Acceptable):
 
         """"""
@@ -120,6 +128,8 @@ class AcceptEncoding(_Accept):
 
     """"""
 
+    __slots__ = ()
+
     # def best_match(self, supported):
     #   acceptable = [p.lower().strip() for p in self.header.split(",")]
     #   for encoding in supported:
@@ -143,6 +153,8 @@ class AcceptLanguage(_Accept):
 
     """"""
 
+    __slots__ = ()
+
     class Language(_Accept._Acceptable):
 
         """"""
@@ -159,6 +171,8 @@ class Authorization(Request):
 
     """"""
 
+    __slots__ = ()
+
     _meta = ""
 
 
@@ -166,6 +180,8 @@ class Cookie(Request):
 
     """"""
 
+    __slots__ = ("morsels",)
+
     def parse(self):
         self.morsels = {}
         for morsel in self.header.split(";"):
@@ -180,20 +196,28 @@ class Expect(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class From(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class Host(Request):
 
     """"""
 
+    __slots__ = ("name", "port")
+
     # TODO support for IP addresses and lazy determination
 
+    def __init__(self, header):
+        super().__init__(str(header).lower())
+
     def parse(self):
-        self.header = self.header.lower()
         self.name, _, port = self.header.partition(":")
         if port is None:
             port = "80"
@@ -212,61 +236,85 @@ class IfMatch(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class IfModifiedSince(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class IfNoneMatch(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class IfRange(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class IfUnmodifiedSince(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class KeepAlive(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class MaxForwards(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class ProxyAuthorization(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class Range(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class Referer(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class TE(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class UserAgent(Request):
 
     """"""
 
+    __slots__ = ("features",)
+
     def parse(self):
         self.features = httpagentparser.simple_detect(self.header)
 
@@ -343,6 +391,8 @@ class XBehavioralAdOptOut(Request):
 
     """"""
 
+    __slots__ = ()
+
     def __repr__(self):
         return repr(bool(self.header))
 
@@ -351,6 +401,8 @@ class XDoNotTrack(Request):
 
     """"""
 
+    __slots__ = ()
+
     def __repr__(self):
         return repr(bool(self.header))
 
@@ -359,11 +411,15 @@ class XForwardedFor(Request):
 
     """"""
 
+    __slots__ = ()
+
 
 class XRequestedWith(Request):
 
     """"""
 
+    __slots__ = ()
+
     @property
     def ajax(self):
         return self.header == "XMLHttpRequest"
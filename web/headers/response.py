@@ -15,41 +15,57 @@ class Response(util.Header):
 
     """"""
 
+    __slots__ = ()
+
 
 class AcceptRanges(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class Age(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class Etag(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class Location(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class ProxyAuthenticate(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class RetryAfter(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class SetCookie(Response):
 
     """"""
 
+    __slots__ = ("cookie",)
+
     def __init__(self, header):
         self.cookie = header
 
@@ -67,17 +83,25 @@ class Server(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class Vary(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class WWWAuthenticate(Response):
 
     """"""
 
+    __slots__ = ()
+
 
 class XPoweredBy(Response):
 
     """"""
+
+    __slots__ = ()
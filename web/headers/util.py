@@ -5,15 +5,30 @@
 
 class Header:
 
-    """"""
+    """
+    a header value whose `parse` runs upon first access of a parsed attribute
+
+    """
+
+    __slots__ = ("header", "_parsed")
 
     def __init__(self, header):
         self.header = str(header).strip()
-        self.parse()
 
     def parse(self):
         pass
 
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            object.__getattribute__(self, "_parsed")
+        except AttributeError:
+            self._parsed = True
+            self.parse()
+            return getattr(self, name)
+        raise AttributeError(name)
+
     def __eq__(self, comparison):
         if isinstance(comparison, str):
             return self.header == comparison
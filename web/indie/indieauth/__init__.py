@@ -13,33 +13,24 @@ client = web.application("IndieAuthClient", mount_prefix="users")
 templates = web.templates(__name__)
 
 
+@web.schema(auths="""auth_id TEXT, initiated DATETIME NOT NULL DEFAULT
+                          CURRENT_TIMESTAMP, revoked DATETIME,
+                      code TEXT, client_id TEXT, client_name TEXT,
+                      code_challenge TEXT, code_challenge_method TEXT,
+                      redirect_uri TEXT, response JSON""")
 def wrap_server(handler, app):
     """Ensure server links are in head of root document."""
-    tx.db.define(auths="""auth_id TEXT, initiated DATETIME NOT NULL DEFAULT
-                              CURRENT_TIMESTAMP, revoked DATETIME,
-                          code TEXT, client_id TEXT, client_name TEXT,
-                          code_challenge TEXT, code_challenge_method TEXT,
-                          redirect_uri TEXT, response JSON""")
     yield
     if tx.request.uri.path == "":
-        doc = web.parse(tx.response.body)
-        try:
-            head = doc.select("head")[0]
-        except IndexError:
-            pass
-        else:
-            head.append("<link rel=authorization_endpoint href=/auth>",
-                        "<link rel=token_endpoint href=/auth/token>")
-            tx.response.body = doc.html
-        web.header("Link", f'</auth>; rel="authorization_endpoint"', add=True)
-        web.header("Link", f'</auth/token>; rel="token_endpoint"', add=True)
+        web.head_link("authorization_endpoint", "/auth")
+        web.head_link("token_endpoint", "/auth/token")
 
 
+@web.schema(users="""account_created DATETIME NOT NULL DEFAULT
+                          CURRENT_TIMESTAMP, url TEXT, name TEXT,
+                      email TEXT, access_token TEXT""")
 def wrap_client(handler, app):
     """Ensure client database contains users table."""
-    tx.db.define(users="""account_created DATETIME NOT NULL DEFAULT
-                              CURRENT_TIMESTAMP, url TEXT, name TEXT,
-                          email TEXT, access_token TEXT""")
     yield
 
 
@@ -12,23 +12,15 @@ server = web.application("MicropubServer", mount_prefix="pub",
 templates = web.templates(__name__)
 
 
+@web.schema(resources="""resource JSON, url TEXT, modified DATETIME""",
+            files="""fid TEXT, sha256 TEXT UNIQUE, size INTEGER""",
+            syndication="""destination JSON NOT NULL""")
 def wrap_server(handler, app):
     """Ensure server links are in head of root document."""
-    tx.db.define(resources="""resource JSON, url TEXT, modified DATETIME""",
-                 files="""fid TEXT, sha256 TEXT UNIQUE, size INTEGER""",
-                 syndication="""destination JSON NOT NULL""")
     tx.pub = LocalClient()
     yield
     if tx.request.uri.path == "":
-        doc = web.parse(tx.response.body)
-        try:
-            head = doc.select("head")[0]
-        except IndexError:
-            pass
-        else:
-            head.append("<link rel=micropub href=/pub>")
-            tx.response.body = doc.html
-        web.header("Link", f'</pub>; rel="micropub"', add=True)
+        web.head_link("micropub", "/pub")
 
 
 def discover_post_type(properties):
@@ -59,6 +51,15 @@ class LocalClient:
         url = f"https://{tx.host.name}/{url}".rstrip("/")
         return tx.db.select("resources", where="url = ?", vals=[url])[0]
 
+    def modified(self, url):
+        """Return when a resource was last modified (for `_last_modified`)."""
+        url = f"https://{tx.host.name}/{url}".rstrip("/")
+        try:
+            return tx.db.select("resources", what="modified",
+                                where="url = ?", vals=[url])[0]["modified"]
+        except IndexError:
+            return None
+
     def read_all(self, limit=20):
         """Return a list of all resources."""
         return tx.db.select("resources", order="modified DESC")
@@ -96,6 +97,7 @@ class LocalClient:
         tx.db.insert("resources", url=url, modified=now,
                      resource={"type": types, "visibility": visibility,
                                "properties": properties})
+        web.purge_pages(url, "")
         # TODO send_webmentions() using tx.cache[]
         return url
 
@@ -8,21 +8,14 @@ server = web.application("MicrosubServer", mount_prefix="sub")
 templates = web.templates(__name__)
 
 
+@web.schema(following="""url TEXT, added DATETIME NOT NULL DEFAULT
+                              CURRENT_TIMESTAMP""")
 def wrap_server(handler, app):
     """Ensure server links are in head of root document."""
-    tx.db.define(following="""url TEXT, added DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP""")
     tx.sub = LocalClient()
     yield
     if tx.request.uri.path == "":
-        doc = web.parse(tx.response.body)
-        try:
-            head = doc.select("head")[0]
-        except IndexError:
-            pass
-        else:
-            head.append("<link rel=microsub href=/sub>")
-            tx.response.body = doc.html
-        web.header("Link", f'</sub>; rel="microsub"', add=True)
+        web.head_link("microsub", "/sub")
 
 
 class LocalClient:
@@ -25,24 +25,16 @@ def send_mention(source, target, private=False) -> None:
     web.post(endpoint, data=payload)
 
 
+@web.schema(mentions="""received DATETIME NOT NULL DEFAULT
+                             CURRENT_TIMESTAMP, mention_id TEXT,
+                         data JSON, source_url TEXT, target_url TEXT""")
 def wrap(handler, app):
     """Ensure endpoint link in head of root document."""
-    tx.db.define(mentions="""received DATETIME NOT NULL DEFAULT
-                                 CURRENT_TIMESTAMP, mention_id TEXT,
-                             data JSON, source_url TEXT, target_url TEXT""")
     # TODO sniff referer header for a mention
     print(f"REFERER: {tx.request.headers.get('Referer')}")
     yield
     if "mentionable" in handler:
-        doc = web.parse(tx.response.body)
-        try:
-            head = doc.select("head")[0]
-        except IndexError:
-            pass
-        else:
-            head.append("<link rel=webmention href=/mentions>")
-            tx.response.body = doc.html
-        web.header("Link", f'</mentions>; rel="webmention"', add=True)
+        web.head_link("webmention", "/mentions")
 
 
 @receiver.route(r"")
@@ -86,6 +78,7 @@ def receive(db, mention_id, source_url, target_url) -> None:
     mention = source_doc.mention(target_url).data  # TODO dict(..) inst .data
     db.update("mentions", what="data = ?", where="mention_id = ?",
               vals=[mention, mention_id])
+    web.purge_pages(web.uri(target_url), app=receiver)
     return
 
     # XXX source_data = mf.parse(source_doc.text, url=source_url)
@@ -12,17 +12,8 @@ def wrap_hub(handler, app):
     """Ensure server links are in head of root document."""
     yield
     if tx.request.uri.path == "":
-        doc = web.parse(tx.response.body)
-        try:
-            head = doc.select("head")[0]
-        except IndexError:
-            pass
-        else:
-            head.append("<link rel=self href=/>")
-            head.append("<link rel=hub href=/hub>")
-            tx.response.body = doc.html
-        web.header("Link", f'</>; rel="self"', add=True)
-        web.header("Link", f'</hub>; rel="hub"', add=True)
+        web.head_link("self", "/")
+        web.head_link("hub", "/hub")
 
 
 @hub.route(r"")
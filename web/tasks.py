@@ -2,70 +2,398 @@
 
 """
 
+import collections
+import concurrent.futures
+import heapq
 import json
 from importlib import import_module
+import os
+import time
 import traceback
 
 import kv
-import gevent.queue
+import gevent
+import gevent.event
+import gevent.pool
 
 # TODO from .agent import Browser
-from .framework import get_app_db
+from . import framework
+from .framework import (delay_jobs, delayed_jobs_key, get_app_db,
+                        get_db_pool, get_job_queue_key, job_lanes,
+                        queue_runs, utcnow)
+from .framework.cron import Cron
 
-queue = gevent.queue.PriorityQueue()
 worker_count = 20
+cpu_worker_count = os.cpu_count() or 1
+process_pool = None
+retry_backoff = 30
+legacy_queue_key = "web:jobqueue"
 
 
-def handle_job(job_identifier):  # , browser):
+def get_process_pool():
+    """
+    return this process's pool for CPU-bound jobs, starting it if need be
+
+    Waiting on a result yields to other greenlets as long as `threading`
+    has been monkey patched, as it must be in the queue runner.
+
+    """
+    global process_pool
+    if process_pool is None:
+        process_pool = concurrent.futures.ProcessPoolExecutor(
+            cpu_worker_count)
+    return process_pool
+
+
+def run_in_process(app_name, module, object, args, kwargs):
+    """run a job in a pool process with the process's own database handle"""
+    return getattr(import_module(module), object)(get_app_db(app_name),
+                                                  *args, **kwargs)
+
+
+def handle_job(job_identifier, requeue=None):  # , browser):
     """
     handle a freshly dequeued job
 
+    The run is read, and its callable run, on a database handle checked
+    out for the job. Its outcome, timings included, is written once
+    through the app's write queue. Until its `max_attempts` are spent a
+    failed run is handed to `requeue(job_identifier, due)` to be retried
+    after an exponential backoff. Callables with a true `cpu_bound`
+    attribute are run in the process pool so they can't stall the other
+    workers.
+
     """
-    # TODO handle retries
-    app_name, _, job_run_id = job_identifier.partition(":")
-    db = get_app_db(app_name)
-    job = db.select("job_runs AS r", what="s.rowid, *",
-                    join="""job_signatures AS s
-                            ON s.rowid = r.job_signature_id""",
-                    where="r.job_id = ?", vals=[job_run_id])[0]
-    _module = job["module"]
-    _object = job["object"]
-    _args = json.loads(job["args"])
-    _kwargs = json.loads(job["kwargs"])
-    print(f"{app_name}/{_module}:{_object}",
-          *(_args + list(f"{k}={v}" for k, v in _kwargs.items())),
-          sep="\n  ", flush=True)
-    db.update("job_runs", where="job_id = ?", vals=[job_run_id],
-              what="started = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')")
-    status = 0
-    try:
-        output = getattr(import_module(_module), _object)(db, *_args,
-                                                          **_kwargs)
-    except Exception as err:
-        status = 1
-        output = str(err)
-        traceback.print_exc()
-    db.update("job_runs", vals=[status, output, job_run_id],
-              what="""finished = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'),
-                      status = ?, output = ?""", where="job_id = ?")
-    run = db.select("job_runs", where="job_id = ?", vals=[job_run_id])[0]
-    st, rt = run["started"] - run["created"], run["finished"] - run["started"]
-    db.update("job_runs", what="start_time = ?, run_time = ?",
-              where="job_id = ?", vals=[f"{st.seconds}.{st.microseconds}",
-                                        f"{rt.seconds}.{rt.microseconds}",
-                                        job_run_id])
-
-
-def run_queue(redis_socket, worker_count=20):
-    """"""
-    kvdb = kv.db("web", ":", {"jobqueue": "list"}, socket=redis_socket)
+    app_name, job_run_id = job_identifier.split(":")[:2]
+    pool = get_db_pool(app_name)
+    with pool.connection() as db:
+        job = db.select("job_runs AS r", what="s.rowid, *",
+                        join="""job_signatures AS s
+                                ON s.rowid = r.job_signature_id""",
+                        where="r.job_id = ?", vals=[job_run_id])[0]
+        _module = job["module"]
+        _object = job["object"]
+        _args = json.loads(job["args"])
+        _kwargs = json.loads(job["kwargs"])
+        print(f"{app_name}/{_module}:{_object}",
+              *(_args + list(f"{k}={v}" for k, v in _kwargs.items())),
+              sep="\n  ", flush=True)
+        started = utcnow()
+        timer = time.perf_counter()
+        status = 0
+        try:
+            handler = getattr(import_module(_module), _object)
+            if getattr(handler, "cpu_bound", False):
+                output = get_process_pool().submit(run_in_process, app_name,
+                                                   _module, _object, _args,
+                                                   _kwargs).result()
+            else:
+                output = handler(db, *_args, **_kwargs)
+        except Exception as err:
+            status = 1
+            output = str(err)
+            traceback.print_exc()
+    run_time = time.perf_counter() - timer
+    finished = started.add(seconds=run_time)
+    start_time = (started - (job["due"] or job["created"])).total_seconds()
+    attempts = job["attempts"] + 1
+    retry_at = None
+    if status and requeue and attempts < job["max_attempts"]:
+        retry_at = finished.add(seconds=retry_backoff * 2 ** (attempts - 1))
+
+    def record(cur):
+        cur.update("job_runs", what="""started = ?, finished = ?,
+                                       start_time = ?, run_time = ?,
+                                       status = ?, output = ?,
+                                       attempts = ?, due = COALESCE(?, due)""",
+                   where="job_id = ?", vals=[started, finished, start_time,
+                                             run_time, status, output,
+                                             attempts, retry_at, job_run_id])
+
+    pool.write(record)
+    if retry_at is not None:
+        print(f"retrying {job_identifier} at {retry_at}", flush=True)
+        requeue(job_identifier, retry_at)
+
+
+class Dispatcher:
+
+    """
+    feed jobs from the kv queues of each lane to a bounded worker pool
+
+    Jobs are pulled in batches of up to the pool's free capacity, lanes
+    in order of priority, and a single blocking pop waits while every
+    lane is empty so that idle workers hold no connections. `caps` limit
+    how many jobs of a type (`module.object`) run at once; jobs over
+    their cap wait locally without taking a worker.
+
+    """
+
+    def __init__(self, redis, worker_count=worker_count, caps=None,
+                 lanes=job_lanes, idle_timeout=5):
+        self.redis = redis
+        self.worker_count = worker_count
+        self.caps = dict(caps or {})
+        self.lanes = lanes
+        self.keys = [get_job_queue_key(lane) for lane in lanes]
+        self.idle_timeout = idle_timeout
+        self.workers = gevent.pool.Pool(worker_count)
+        self.in_flight = collections.Counter()
+        self.waiting = collections.defaultdict(collections.deque)
+        self.finished = gevent.event.Event()
+
+    def queue_depths(self):
+        """return the number of jobs queued in each lane"""
+        pipeline = self.redis.pipeline(transaction=False)
+        for key in self.keys:
+            pipeline.llen(key)
+        return dict(zip(self.lanes, pipeline.execute()))
+
+    def stats(self):
+        """return queue depths and the jobs running and waiting per type"""
+        return {"queued": self.queue_depths(),
+                "in_flight": dict(+self.in_flight),
+                "waiting": {job_type: len(jobs) for job_type, jobs
+                            in self.waiting.items() if jobs}}
+
+    def pull(self, count):
+        """pop up to `count` jobs across the lanes in order of priority"""
+        pulled = []
+        for lane, key in zip(self.lanes, self.keys):
+            if len(pulled) == count:
+                break
+            pipeline = self.redis.pipeline()
+            pipeline.lrange(key, 0, count - len(pulled) - 1)
+            pipeline.ltrim(key, count - len(pulled), -1)
+            jobs, _ = pipeline.execute()
+            pulled.extend((key, job) for job in jobs)
+        return pulled
+
+    def run(self):
+        """dispatch jobs forever"""
+        while True:
+            waiting = sum(len(jobs) for jobs in self.waiting.values())
+            free = self.worker_count - sum(self.in_flight.values())
+            if free <= 0 or waiting >= self.worker_count:
+                self.finished.clear()
+                self.finished.wait()
+                continue
+            jobs = self.pull(free)
+            if not jobs:
+                popped = self.redis.blpop(self.keys, timeout=self.idle_timeout)
+                if popped is None:
+                    continue
+                jobs = [popped]
+            for key, job in jobs:
+                self.dispatch(key, job)
+
+    def dispatch(self, key, job):
+        if isinstance(key, bytes):
+            key = key.decode("utf-8")
+        if isinstance(job, bytes):
+            job = job.decode("utf-8")
+        job_type = job.split(":", 2)[2] if job.count(":") > 1 else ""
+        cap = self.caps.get(job_type)
+        if cap is not None and self.in_flight[job_type] >= cap:
+            self.waiting[job_type].append((key, job))
+            return
+        self.in_flight[job_type] += 1
+        self.workers.spawn(self.work, key, job, job_type)
+
+    def work(self, key, job, job_type):
+        try:
+            handle_job(job, lambda job, due: delay_jobs(self.redis, key,
+                                                        [job], due))
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.in_flight[job_type] -= 1
+            if self.waiting[job_type]:
+                self.dispatch(*self.waiting[job_type].popleft())
+            self.finished.set()
+
+
+class Scheduler:
+
+    """
+    enqueue the jobs in an app's `job_schedules` as they fall due
 
-    def run_worker():
-        for job in kvdb["jobqueue"].keep_popping():
-            handle_job(job)
+    Upcoming fires are kept in a min-heap so only the schedules that are
+    due get looked at; schedules are reloaded every `reload_interval`
+    seconds. Each fire is claimed by advancing its schedule's
+    `last_fired` with a conditional update so that when several queue
+    runners are alive exactly one of them enqueues it. Fires missed while
+    no runner was alive are made up for with a single run.
 
-    for _ in range(worker_count):
-        gevent.spawn(run_worker)
+    """
+
+    def __init__(self, app_name, redis, reload_interval=60):
+        self.app_name = app_name
+        self.redis = redis
+        self.reload_interval = reload_interval
+        self.pool = get_db_pool(app_name)
+        self.heap = []
+
+    def load(self):
+        """rebuild the heap of upcoming fires from the app's schedules"""
+        now = utcnow()
+        self.heap = []
+        rows = self.pool.db.select("job_schedules AS c",
+                                   what="""c.rowid AS schedule_id, c.*,
+                                           s.module, s.object, s.args,
+                                           s.kwargs""",
+                                   join="""job_signatures AS s
+                                           ON s.rowid = c.job_signature_id""")
+        for row in rows:
+            fields = (row["minute"], row["hour"], row["day_of_month"],
+                      row["month"], row["day_of_week"])
+            try:
+                cron = Cron(" ".join(fields))
+            except ValueError:
+                traceback.print_exc()
+                continue
+            fire = cron.next_fire(row["last_fired"] or now)
+            if fire is not None:
+                self.heap.append((fire, row["schedule_id"], cron,
+                                  row["module"], row["object"], row["args"],
+                                  row["kwargs"]))
+        heapq.heapify(self.heap)
+
+    def run(self):
+        """fire schedules forever"""
+        while True:
+            try:
+                self.load()
+            except Exception:
+                traceback.print_exc()
+            reload_at = time.monotonic() + self.reload_interval
+            while True:
+                now = utcnow()
+                while self.heap and self.heap[0][0] <= now:
+                    fire, schedule_id, cron, *job = heapq.heappop(self.heap)
+                    try:
+                        self.fire(fire, now, schedule_id, *job)
+                    except Exception:  # an unclaimed fire is made up later
+                        traceback.print_exc()
+                    upcoming = cron.next_fire(now)
+                    if upcoming is not None:
+                        heapq.heappush(self.heap, (upcoming, schedule_id, cron,
+                                                   *job))
+                remaining = reload_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.heap:
+                    remaining = min(remaining,
+                                    (self.heap[0][0] - now).total_seconds())
+                gevent.sleep(remaining)
+
+    def fire(self, fire, now, schedule_id, module, object, args, kwargs):
+        """enqueue a due run unless another runner has already claimed it"""
+        stamp = fire.strftime("%Y-%m-%d %H:%M:%S")
+
+        def claim(cur):
+            return cur.cur.execute("""UPDATE job_schedules SET last_fired = ?
+                                      WHERE rowid = ? AND (last_fired IS NULL
+                                      OR last_fired < ?)""",
+                                   [now.strftime("%Y-%m-%d %H:%M:%S"),
+                                    schedule_id, stamp]).rowcount
+
+        if not self.pool.write(claim):
+            return
+        try:
+            callable = getattr(import_module(module), object)
+        except (ImportError, AttributeError):
+            traceback.print_exc()
+            return
+        queue_runs(self.app_name, self.redis,
+                   [(callable, json.loads(args), json.loads(kwargs))])
+
+
+class Promoter:
+
+    """
+    move delayed jobs onto their queues in batches once they fall due
+
+    Each batch is moved by a script that runs atomically in the kv store
+    so that when several queue runners are alive a job is moved once.
+
+    """
+
+    script = """local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf',
+                                      ARGV[1], 'LIMIT', 0, ARGV[2])
+                for _, member in ipairs(due) do
+                    local space = string.find(member, ' ', 1, true)
+                    redis.call('RPUSH', string.sub(member, 1, space - 1),
+                               string.sub(member, space + 1))
+                end
+                if #due > 0 then
+                    redis.call('ZREM', KEYS[1], unpack(due))
+                end
+                return #due"""
+
+    def __init__(self, redis, batch_size=100, interval=1):
+        self.redis = redis
+        self.batch_size = batch_size
+        self.interval = interval
+        self.promote_due = redis.register_script(self.script)
+
+    def promote(self):
+        """queue a batch of due jobs and return how many were moved"""
+        return self.promote_due(keys=[delayed_jobs_key],
+                                args=[time.time(), self.batch_size])
+
+    def run(self):
+        """promote due jobs forever"""
+        while True:
+            try:
+                moved = self.promote()
+            except Exception:
+                traceback.print_exc()
+                moved = 0
+            if moved < self.batch_size:
+                gevent.sleep(self.interval)
+
+
+drain_script = """local moved = 0
+                  while true do
+                      local jobs = redis.call('LRANGE', KEYS[1], 0,
+                                              ARGV[1] - 1)
+                      if #jobs == 0 then
+                          return moved
+                      end
+                      redis.call('RPUSH', KEYS[2], unpack(jobs))
+                      redis.call('LTRIM', KEYS[1], #jobs, -1)
+                      moved = moved + #jobs
+                  end"""
+
+
+def drain_legacy_queue(redis, batch_size=1000):
+    """
+    move jobs left on the single pre-lane queue onto the `default` lane
+
+    The move is atomic so that concurrently starting queue runners move
+    each job once. Returns the number of jobs moved.
+
+    """
+    return redis.register_script(drain_script)(
+        keys=[legacy_queue_key, get_job_queue_key("default")],
+        args=[batch_size])
+
+
+def run_queue(redis_socket, worker_count=worker_count, caps=None,
+              scheduled_apps=()):
+    """"""
+    framework.db_pool_size = max(framework.db_pool_size, worker_count)
+    for pool in framework.db_pools.values():  # let every worker hold one
+        pool.size = max(pool.size, framework.db_pool_size)
+    kvdb = kv.db("web", ":", {"jobqueue": "list"}, socket=redis_socket)
+    drain_legacy_queue(kvdb.db)
+    dispatcher = Dispatcher(kvdb.db, worker_count=worker_count, caps=caps)
+    gevent.spawn(dispatcher.run)
+    gevent.spawn(Promoter(kvdb.db).run)
+    for app_name in scheduled_apps:
+        gevent.spawn(Scheduler(app_name, kvdb.db).run)
+    return dispatcher
 
 
 # TODO @main.register()
@@ -0,0 +1,256 @@
+"""
+Micro-benchmarks for the hot paths of `web`.
+
+    $ python web_benchmarks.py
+
+"""
+
+from gevent import monkey
+monkey.patch_all()  # as in the queue runner and under uWSGI
+
+import contextlib  # noqa: E402
+import io  # noqa: E402
+import json  # noqa: E402
+import re  # noqa: E402
+import socket  # noqa: E402
+import time  # noqa: E402
+import timeit  # noqa: E402
+import urllib.parse  # noqa: E402
+
+import gevent  # noqa: E402
+import gevent.pool  # noqa: E402
+import gevent.pywsgi  # noqa: E402
+import gevent.socket  # noqa: E402
+import requests  # noqa: E402
+
+from web import agent, tasks  # noqa: E402
+from web.agent import parse  # noqa: E402
+from web.framework import (Router, find_job_signature,  # noqa: E402
+                           get_db_pool, nbrandom, splice_head)
+from web.framework.sessions import KVSessionStore  # noqa: E402
+
+
+def report(name, *columns):
+    """print a row of results"""
+    print(f"{name:<24}", *(f"{c:>14}" for c in columns))
+
+
+def bench_routing(route_counts=(10, 100, 500, 1000), number=200):
+    """compare a linear scan of route patterns to the precompiled router"""
+    report("routes", "linear (us)", "router (us)", "memoized (us)")
+    for count in route_counts:
+        routes = [(rf"section{n}/(?P<slug>[\w-]+)", f"Section{n}")
+                  for n in range(count)]
+        router = Router(cache_size=0)
+        memoized = Router()
+        for pattern, resource in routes:
+            router.add_route(pattern, resource)
+            memoized.add_route(pattern, resource)
+        path = f"section{count - 1}/hello-world"
+        router.compile()
+        memoized.compile()
+
+        def linear():
+            for pattern, resource in routes:
+                match = re.match(r"^{}$".format(pattern),
+                                 urllib.parse.unquote(path))
+                if match:
+                    return resource, match
+
+        timings = [timeit.timeit(handler, number=number) / number * 1e6
+                   for handler in (linear, lambda: router.resolve(path),
+                                   lambda: memoized.resolve(path))]
+        report(count, *(f"{t:.2f}" for t in timings))
+
+
+def bench_head_injection(paragraphs=5000, number=20):
+    """compare per-wrapper DOM round trips to a single head splice"""
+    page = ("<!doctype html><html><head><title>Large</title></head><body>" +
+            "".join(f"<p id=p{n}>lorem <em>ipsum</em> {n}</p>"
+                    for n in range(paragraphs)) + "</body></html>")
+    links = [("icon", "/icon.png"), ("webmention", "/mentions"),
+             ("micropub", "/pub"), ("microsub", "/sub"),
+             ("authorization_endpoint", "/auth"),
+             ("token_endpoint", "/auth/token")]
+
+    def reparse():
+        body = page
+        for rel, href in links:
+            doc = parse(body)
+            doc.select("head")[0].append(f"<link rel={rel} href={href}>")
+            body = doc.html
+        return body.encode("utf-8")
+
+    def splice():
+        return splice_head(page.encode("utf-8"),
+                           [f'<link rel="{rel}" href="{href}">'
+                            for rel, href in links])
+
+    report("page bytes", "reparse (ms)", "splice (ms)")
+    timings = [timeit.timeit(handler, number=number) / number * 1e3
+               for handler in (reparse, splice)]
+    report(len(page), *(f"{t:.2f}" for t in timings))
+
+
+class RoundTrips:
+
+    """a redis client proxy that counts round trips to the server"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.count = 0
+
+    def pipeline(self, **kwargs):
+        pipeline = self.redis.pipeline(**kwargs)
+        execute = pipeline.execute
+
+        def counted_execute():
+            self.count += 1
+            return execute()
+
+        pipeline.execute = counted_execute
+        return pipeline
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        def counted_command(*args, **kwargs):
+            self.count += 1
+            return command(*args, **kwargs)
+
+        return counted_command
+
+
+def bench_sessions(number=2000, timeout=86400):
+    """compare per-request session overhead of the kv session stores"""
+    try:
+        import fakeredis
+    except ImportError:
+        print("sessions: install `fakeredis` as a local redis stand-in")
+        return
+    redis = RoundTrips(fakeredis.FakeRedis())
+    identifier = "0" * 64
+    session = {"me": "https://example.com", "role": "owner"}
+    key = f"web:sessions:{identifier}"
+    redis.set(f"{key}:data", json.dumps(session))
+
+    def sequential():  # the round trips made by the former `sessions` hook
+        if not redis.exists(key):
+            redis.setnx(key, "anonymous")
+        redis.expire(key, timeout)
+        data = json.loads(redis.get(f"{key}:data"))
+        redis.set(f"{key}:data", json.dumps(data))
+        redis.expire(f"{key}:data", timeout)
+
+    uncached = KVSessionStore(redis, local_ttl=-1)
+    cached = KVSessionStore(redis)
+
+    def pipelined_read():
+        uncached.load(identifier)
+        uncached.touch(identifier)
+
+    def pipelined_write():
+        data = uncached.load(identifier)
+        uncached.save(identifier, data)
+
+    def cached_read():
+        cached.load(identifier)
+        cached.touch(identifier)
+
+    report("sessions", "us/request", "trips/request")
+    for name, handler in (("sequential", sequential),
+                          ("pipelined read", pipelined_read),
+                          ("pipelined write", pipelined_write),
+                          ("locally cached read", cached_read)):
+        redis.count = 0
+        duration = timeit.timeit(handler, number=number) / number * 1e6
+        report(name, f"{duration:.2f}", f"{redis.count / number:.2f}")
+
+
+def cpu_job(db, iterations):
+    """a job that keeps the CPU busy"""
+    total = 0
+    for number in range(iterations):
+        total += number * number
+    return total
+
+
+def io_job(db, delay):
+    """a job that waits on the network"""
+    gevent.sleep(delay)
+    return delay
+
+
+def bench_jobs(cpu_jobs=8, io_jobs=40, iterations=2_000_000, delay=0.05):
+    """compare mixed workloads with CPU-bound jobs inline and in processes"""
+    db = get_db_pool("benchmarks").shared
+    jobs = ([(cpu_job, iterations)] * cpu_jobs +
+            [(io_job, delay)] * io_jobs)
+    jobs = jobs[::2] + jobs[1::2]
+    for _ in range(tasks.cpu_worker_count):
+        tasks.get_process_pool().submit(int)
+    report("jobs", "wall (s)", "io p50 (ms)", "io max (ms)")
+    for name, cpu_bound in (("inline", False), ("process pool", True)):
+        cpu_job.cpu_bound = cpu_bound
+        identifiers = []
+        for handler, argument in jobs:
+            job_signature_id = find_job_signature(db, handler, [argument], {})
+            job_id = nbrandom(9)
+            db.insert("job_runs", job_signature_id=job_signature_id,
+                      job_id=job_id)
+            identifiers.append((handler, f"benchmarks:{job_id}"))
+        latencies = []
+        start = time.perf_counter()
+
+        def run(handler, identifier):
+            tasks.handle_job(identifier)
+            if handler is io_job:
+                latencies.append(time.perf_counter() - start)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            gevent.joinall([gevent.spawn(run, *job) for job in identifiers])
+        wall = time.perf_counter() - start
+        latencies.sort()
+        median = latencies[len(latencies) // 2]
+        report(name, f"{wall:.2f}", f"{median * 1e3:.0f}",
+               f"{latencies[-1] * 1e3:.0f}")
+
+
+def bench_agent(number=500, concurrency=10):
+    """compare fresh connections per request to pooled keep-alive sessions"""
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain"),
+                                  ("Content-Length", "2")])
+        return [b"ok"]
+
+    listener = gevent.socket.socket()
+    listener.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(128)  # without NODELAY keep-alive stalls on delayed ACKs
+    server = gevent.pywsgi.WSGIServer(listener, app, log=None)
+    server.start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    pool = agent.SessionPool(size=concurrency)
+    report("agent", "req/s", f"x{concurrency} req/s")
+    for name, fetch in (("fresh connections", requests.get),
+                        ("session pool", lambda url: pool.request("GET",
+                                                                  url))):
+        rates = []
+        for greenlets in (1, concurrency):
+            workers = gevent.pool.Pool(greenlets)
+            start = time.perf_counter()
+            for _ in range(number):
+                workers.spawn(fetch, url)
+            workers.join()
+            rates.append(number / (time.perf_counter() - start))
+        report(name, *(f"{rate:.0f}" for rate in rates))
+    pool.close()
+    server.stop()
+
+
+if __name__ == "__main__":
+    bench_routing()
+    bench_head_injection()
+    bench_sessions()
+    bench_jobs()
+    bench_agent()